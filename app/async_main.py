@@ -0,0 +1,175 @@
+# async_main.py
+
+from .startup import boot
+
+import asyncio
+import os
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.context.respond import Respond
+from aiohttp import web
+from slack_bolt.context.say import Say
+from .config import (
+    SLACK_BOT_TOKEN,
+    SLACK_SIGNING_SECRET,
+    ASYNC_WORKERS,
+    EVENT_QUEUE_SIZE,
+)
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from .handlers.message_handler import MessageHandler
+from .dispatcher import EventDispatcher, thread_key
+from .slack_api import GatewayWebClient, SlackClient
+from .llm import LLMClient
+from .database import Database
+from .extractors import start_pdf_workers
+from .identity import identity
+from .logger import logger
+from .metrics import CONTENT_TYPE, registry
+
+boot.imports_done()
+
+with boot.phase("pdf_workers"):
+    # Forked before any thread exists
+    start_pdf_workers()
+with boot.phase("slack_app"):
+    app = AsyncApp(token=SLACK_BOT_TOKEN, signing_secret=SLACK_SIGNING_SECRET)
+    # MessageHandler is blocking code, so the workers drive it with a sync WebClient
+    web_client = GatewayWebClient(token=SLACK_BOT_TOKEN)
+    slack_client = SlackClient(web_client)
+with boot.phase("identity"):
+    identity.resolve(web_client)
+with boot.phase("llm_client"):
+    llm_client = LLMClient()
+with boot.phase("database"):
+    database = Database.get_instance()
+    database.ensure_indexes_in_background()
+with boot.phase("message_handler"):
+    message_handler = MessageHandler(slack_client, llm_client, database)
+dispatcher = EventDispatcher(num_workers=ASYNC_WORKERS, queue_size=EVENT_QUEUE_SIZE)
+registry.gauge(
+    "sparrow_dispatcher_queue_depth",
+    "Events waiting for a dispatcher worker.",
+    (),
+    lambda: {(): dispatcher.qsize()},
+)
+
+
+async def metrics(request):
+    return web.Response(
+        body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE}
+    )
+
+
+def _noop_ack(*args, **kwargs):
+    pass
+
+
+def _sync_respond(body):
+    return Respond(response_url=body.get("response_url"))
+
+
+@app.event("url_verification")
+async def handle_url_verification(ack, body):
+    await ack(body.get("challenge"))
+
+
+@app.event("message")
+async def handle_message(ack, body, event, message):
+    await ack()
+    boot.first_event()
+    deduplicator = message_handler.deduplicator
+    if deduplicator.shared:
+        first = await asyncio.to_thread(
+            deduplicator.first_delivery, event, body.get("event_id")
+        )
+    else:
+        first = deduplicator.first_delivery(event, body.get("event_id"))
+    if not first:
+        logger.info(f"Dropping duplicate delivery of {body.get('event_id')}")
+        return
+    say = Say(client=web_client, channel=event.get("channel"))
+    await dispatcher.submit(
+        thread_key(event),
+        message_handler.process_message_event,
+        web_client,
+        event,
+        message,
+        say,
+    )
+
+
+@app.event("reaction_added")
+async def handle_reaction_added(ack, event):
+    await ack()
+    await asyncio.to_thread(
+        message_handler.handle_reaction_added, _noop_ack, web_client, event
+    )
+
+
+# Command handlers
+@app.command("/sparrow")
+async def handle_sparrow(ack, command):
+    await ack()
+    await asyncio.to_thread(
+        message_handler.handle_sparrow,
+        _noop_ack,
+        web_client,
+        _sync_respond(command),
+        command,
+    )
+
+
+# Action handlers
+@app.action("start_onboarding")
+async def handle_onboarding_modal_open(ack, body):
+    # Acked before the thread hop; the trigger_id is only valid for 3 seconds
+    await ack()
+    await asyncio.to_thread(
+        message_handler.handle_onboarding_modal_open, _noop_ack, body, web_client
+    )
+
+
+@app.action("create_jira_yes")
+async def handle_create_jira_yes(ack, body):
+    await ack()
+    await asyncio.to_thread(
+        message_handler.handle_create_jira_yes,
+        _noop_ack,
+        body,
+        web_client,
+        _sync_respond(body),
+    )
+
+
+@app.action("create_jira_no")
+async def handle_create_jira_no(ack, body):
+    await ack()
+    say = Say(client=web_client, channel=body.get("channel", {}).get("id"))
+    await asyncio.to_thread(
+        message_handler.handle_create_jira_no,
+        _noop_ack,
+        body,
+        web_client,
+        say,
+        _sync_respond(body),
+    )
+
+
+# View handlers
+@app.view("onboarding_modal")
+async def handle_onboarding_modal_submit(ack, body, view):
+    await ack()
+    await asyncio.to_thread(
+        message_handler.handle_onboarding_modal_submit, _noop_ack, body, view
+    )
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 3000))
+    print(f"Starting async app on port {port}")
+    boot.ready()
+    server = app.server(port=port)
+    server.web_app.router.add_get("/metrics", metrics)
+    server.start()
@@ -0,0 +1,155 @@
+# audio.py
+
+import shutil
+import subprocess
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Callable, List, Optional, Tuple
+
+from .downloads import temporary_path
+from .logger import logger
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def decode_to_pcm(file_path: str, output_path: str) -> None:
+    """
+    Downmixes and resamples any audio/video file to raw 16 kHz mono 16-bit PCM.
+    """
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-nostdin",
+            "-loglevel",
+            "error",
+            "-y",
+            "-i",
+            file_path,
+            "-vn",
+            "-ac",
+            "1",
+            "-ar",
+            str(SAMPLE_RATE),
+            "-f",
+            "s16le",
+            output_path,
+        ],
+        check=True,
+        timeout=600,
+    )
+
+
+def find_segments(
+    samples,
+    sample_rate: int = SAMPLE_RATE,
+    min_seconds: float = 45.0,
+    max_seconds: float = 90.0,
+) -> List[Tuple[int, int]]:
+    """
+    Splits audio into segments between ``min_seconds`` and ``max_seconds``
+    long, cutting at the quietest 30 ms frame in that range so words are not
+    split across segments.
+
+    :param samples: 1-D int16 array of mono samples.
+    :return: ``(start, end)`` sample offsets covering the whole recording.
+    """
+    import numpy as np
+
+    frame = max(1, int(sample_rate * FRAME_SECONDS))
+    total = len(samples)
+    segments = []
+    start = 0
+    while total - start > int(max_seconds * sample_rate):
+        low = start + int(min_seconds * sample_rate)
+        high = start + int(max_seconds * sample_rate)
+        window = np.asarray(samples[low:high], dtype=np.float32)
+        frames = len(window) // frame
+        energy = np.sqrt(
+            np.mean(window[: frames * frame].reshape(frames, frame) ** 2, axis=1)
+        )
+        cut = low + int(energy.argmin()) * frame + frame // 2
+        segments.append((start, cut))
+        start = cut
+    segments.append((start, total))
+    return segments
+
+
+def write_wav(path: str, samples, sample_rate: int = SAMPLE_RATE) -> None:
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.tobytes())
+
+
+def format_timestamp(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def transcribe_in_segments(
+    file_path: str,
+    transcribe: Callable[[str], Optional[str]],
+    concurrency: int = 4,
+    single_request_seconds: float = 120.0,
+) -> Optional[str]:
+    """
+    Transcribes a recording by splitting it on silence and transcribing the
+    segments concurrently, then stitching them back together with timestamps.
+
+    Short recordings are sent as a single 16 kHz mono WAV. Hosts without
+    ffmpeg send the original file in a single request.
+
+    :param file_path: Path to the original audio or video file.
+    :param transcribe: Transcribes one audio file and returns its text.
+    :param concurrency: Maximum segments transcribed at once.
+    :param single_request_seconds: Recordings up to this long are not split.
+    :return: The stitched transcript, or None if every segment failed.
+    """
+    if not ffmpeg_available():
+        logger.warning("ffmpeg not found, transcribing audio in a single request")
+        return transcribe(file_path)
+
+    import numpy as np
+
+    with ExitStack() as stack:
+        pcm_path = stack.enter_context(temporary_path(".pcm"))
+        decode_to_pcm(file_path, pcm_path)
+        samples = np.memmap(pcm_path, dtype=np.int16, mode="r")
+        duration = len(samples) / SAMPLE_RATE
+        if duration <= single_request_seconds:
+            # The 16 kHz mono downmix keeps e.g. screen recordings well under
+            # Whisper's upload limit
+            wav_path = stack.enter_context(temporary_path(".wav"))
+            write_wav(wav_path, np.asarray(samples))
+            return transcribe(wav_path)
+
+        segments = find_segments(samples)
+        paths = []
+        for start, end in segments:
+            path = stack.enter_context(temporary_path(".wav"))
+            write_wav(path, np.asarray(samples[start:end]))
+            paths.append(path)
+        logger.info(
+            f"Transcribing {duration:.0f}s of audio in {len(segments)} segments"
+        )
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            texts = list(executor.map(transcribe, paths))
+
+    if not any(texts):
+        return None
+    lines = []
+    for (start, _), text in zip(segments, texts):
+        marker = format_timestamp(start / SAMPLE_RATE)
+        lines.append(f"[{marker}] {text.strip() if text else '(inaudible)'}")
+    return "\n".join(lines)
@@ -0,0 +1,173 @@
+# benchmarks.py
+
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, Tuple
+
+SAMPLE_MARKDOWN = """
+## Summary
+
+Here's what I found in the **login flow**:
+
+1. The `session` cookie is *not* refreshed after [OAuth](https://oauth.net/2/) redirects.
+2. Tokens expire after ~~60~~ 30 minutes.
+
+- Retry logic lives in `auth/retry.py`
+  - Backoff is **exponential**
+
+| Endpoint | p95 (ms) |
+|----------|----------|
+| /login   | 420      |
+| /refresh | 1310     |
+
+```python
+def refresh(session):
+    return session.renew()
+```
+
+> Let me know if you want me to open a ticket!
+"""
+
+
+def _time(func: Callable[[], object], iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def benchmark_formatting(iterations: int = 1000, llm_iterations: int = 3) -> Dict[str, float]:
+    """
+    Compares the local mrkdwn converter with the previous LLM formatting pass.
+
+    The LLM path only runs when provider keys are configured.
+    """
+    from .formatting import markdown_to_mrkdwn
+
+    results = {"local_seconds": _time(lambda: markdown_to_mrkdwn(SAMPLE_MARKDOWN), iterations)}
+    print(f"local converter: {results['local_seconds'] * 1000:.3f} ms/response")
+
+    try:
+        from .llm import LLMClient
+        from .prompts import formatting_prompt
+
+        llm_client = LLMClient()
+        results["llm_seconds"] = _time(
+            lambda: llm_client.llm_response(
+                messages=[
+                    {"role": "system", "content": formatting_prompt},
+                    {"role": "user", "content": SAMPLE_MARKDOWN},
+                ],
+                temperature=0.0,
+                client_name="groq",
+            ),
+            llm_iterations,
+        )
+        print(f"llm formatting:  {results['llm_seconds'] * 1000:.1f} ms/response")
+        print(f"speedup:         {results['llm_seconds'] / results['local_seconds']:.0f}x")
+    except Exception as e:
+        print(f"llm formatting:  skipped ({e})")
+    return results
+
+
+def _write_sample_pdf(path: str, pages: int) -> None:
+    """
+    Writes a minimal text-only PDF with ``pages`` pages of filler text.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for number in range(pages):
+        lines = "".join(
+            f"(Page {number + 1} line {line}: the quick brown fox jumps over the lazy dog.) Tj T* "
+            for line in range(40)
+        )
+        stream = f"BT /F1 10 Tf 14 TL 40 800 Td {lines}ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (len(objects))
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids),
+        pages,
+    )
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for index, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += b"%d 0 obj\n" % index + obj + b"\nendobj\n"
+    xref = len(body)
+    body += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    body += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    body += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as file:
+        file.write(body)
+
+
+def _measure(func: Callable[[], object]) -> Tuple[float, int]:
+    """
+    Returns wall-clock seconds and peak traced memory in bytes. Memory is
+    measured in a second run because tracemalloc slows pure-Python code.
+    """
+    seconds = _time(func, 1)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def benchmark_extraction(pdf_pages: int = 120) -> Dict[str, float]:
+    """
+    Compares the native extractors with llama-index's SimpleDirectoryReader
+    on generated source, JSON and PDF uploads (time and peak Python memory).
+    """
+    from .extractors import extract_text, extract_with_llama_index, start_pdf_workers
+
+    start_pdf_workers()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        samples = {
+            "py": "def handler(event):\n    return {'ok': True, 'event': event}\n\n" * 2000,
+            "json": json.dumps([{"id": index, "text": "lorem ipsum " * 8} for index in range(2000)]),
+        }
+        paths = {}
+        for extension, content in samples.items():
+            paths[extension] = os.path.join(directory, f"sample.{extension}")
+            with open(paths[extension], "w") as file:
+                file.write(content)
+        paths["pdf"] = os.path.join(directory, "sample.pdf")
+        _write_sample_pdf(paths["pdf"], pdf_pages)
+
+        cold_seconds = _time(lambda: extract_with_llama_index(paths["py"]), 1)
+        results["llama_index_cold_seconds"] = cold_seconds
+        print(f"llama-index first call (import included): {cold_seconds * 1000:.0f} ms")
+        for extension, path in paths.items():
+            native_seconds, native_peak = _measure(lambda: extract_text(path))
+            llama_seconds, llama_peak = _measure(lambda: extract_with_llama_index(path))
+            results[f"{extension}_native_seconds"] = native_seconds
+            results[f"{extension}_llama_index_seconds"] = llama_seconds
+            print(
+                f"{extension:>5}: native {native_seconds * 1000:8.1f} ms {native_peak / 1e6:6.1f} MB"
+                f" | llama-index {llama_seconds * 1000:8.1f} ms {llama_peak / 1e6:6.1f} MB"
+            )
+    return results
+
+
+BENCHMARKS = {
+    "formatting": benchmark_formatting,
+    "extraction": benchmark_extraction,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name}")
+        BENCHMARKS[name]()
@@ -0,0 +1,248 @@
+# cache.py
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .logger import logger
+
+
+class TTLCache:
+    """
+    A thread-safe LRU cache whose entries also expire after a fixed time-to-live.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        """
+        :param maxsize: Maximum number of entries before the least recently used is evicted.
+        :param ttl: Seconds an entry stays valid, or None to never expire.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl if self.ttl else 0
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and not (
+                item[0] and item[0] < time.monotonic()
+            )
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ConversationCache:
+    """
+    Caches the formatted history of Slack threads keyed by ``(channel, thread_ts)``.
+
+    Each entry holds the ``{"role", "content"}`` message list sent to the LLM and
+    whether the bot has posted in the thread, so warm threads need no
+    ``conversations_replies`` calls at all.
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: Optional[float] = 3600):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.RLock()
+
+    def get(self, channel: str, thread_ts: str) -> Optional[Dict[str, Any]]:
+        return self._cache.get((channel, thread_ts))
+
+    def load(
+        self, channel: str, thread_ts: str, messages: List[Dict[str, str]], bot_in_thread: bool
+    ) -> Dict[str, Any]:
+        entry = {"messages": list(messages), "bot_in_thread": bot_in_thread}
+        self._cache.set((channel, thread_ts), entry)
+        return entry
+
+    def append(
+        self, channel: str, thread_ts: str, role: str, content: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Appends a message to a warm entry. Cold threads are left alone so the
+        next read fetches the complete history.
+        """
+        with self._lock:
+            entry = self._cache.get((channel, thread_ts))
+            if entry is None:
+                return None
+            if content:
+                entry["messages"].append({"role": role, "content": content})
+            if role == "assistant":
+                entry["bot_in_thread"] = True
+            self._cache.set((channel, thread_ts), entry)
+            return entry
+
+    def invalidate(self, channel: str, thread_ts: str) -> None:
+        self._cache.pop((channel, thread_ts))
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def hit_ratio(self) -> float:
+        return self._cache.hit_ratio()
+
+
+class FileContentCache:
+    """
+    Content-addressed cache for text derived from uploaded files (image
+    descriptions, transcripts, extracted text).
+
+    Entries are keyed by the kind of derivation, the SHA-256 of the file bytes
+    and, for vision, the prompt. A small side index maps Slack file ids to their
+    digest so a file seen before can be served without downloading it again.
+    The in-memory tier is an LRU bounded by total stored characters; an optional
+    Mongo collection acts as a persistent second tier shared across processes.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 50 * 1024 * 1024,
+        collection_factory: Optional[Callable[[], Any]] = None,
+    ):
+        """
+        :param max_bytes: Approximate size bound of the in-memory tier.
+        :param collection_factory: Returns the Mongo collection for the persistent tier, or None to disable it.
+        """
+        self.max_bytes = max_bytes
+        self._collection_factory = collection_factory
+        self._collection = None
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._size = 0
+        self._file_digests = TTLCache(maxsize=10000)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(kind: str, digest: str, prompt: Optional[str] = None) -> str:
+        key = f"{kind}:{digest}"
+        if prompt:
+            key += ":" + hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+        return key
+
+    def digest_for(self, file_id: str) -> Optional[str]:
+        return self._file_digests.get(file_id)
+
+    def remember_digest(self, file_id: str, digest: str) -> None:
+        self._file_digests.set(file_id, digest)
+
+    def get(self, kind: str, digest: str, prompt: Optional[str] = None) -> Optional[str]:
+        key = self.make_key(kind, digest, prompt)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = self._get_persistent(key)
+        if value is not None:
+            self._set_memory(key, value)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        return None
+
+    def set(
+        self,
+        kind: str,
+        digest: str,
+        value: str,
+        prompt: Optional[str] = None,
+        file_id: Optional[str] = None,
+    ) -> None:
+        key = self.make_key(kind, digest, prompt)
+        self._set_memory(key, value)
+        self._set_persistent(key, value, file_id)
+
+    def _set_memory(self, key: str, value: str) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _persistent_collection(self):
+        if self._collection is None and self._collection_factory is not None:
+            self._collection = self._collection_factory()
+        return self._collection
+
+    def _get_persistent(self, key: str) -> Optional[str]:
+        try:
+            collection = self._persistent_collection()
+            if collection is None:
+                return None
+            document = collection.find_one({"_id": key})
+            return document.get("content") if document else None
+        except Exception as e:
+            logger.warning(f"File cache lookup failed: {e}")
+            return None
+
+    def _set_persistent(self, key: str, value: str, file_id: Optional[str]) -> None:
+        try:
+            collection = self._persistent_collection()
+            if collection is None:
+                return
+            collection.update_one(
+                {"_id": key},
+                {"$set": {"content": value, "file_id": file_id}},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning(f"File cache write failed: {e}")
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,499 @@
+# classifier.py
+
+import datetime
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cache import TTLCache
+from .logger import logger
+from .models import RequestType
+from .prompts import classify_request
+
+# Cached classifications are invalidated whenever the classification prompt changes
+PROMPT_VERSION = hashlib.sha256(classify_request.encode("utf-8")).hexdigest()[:12]
+
+MENTION_PATTERN = re.compile(r"<@[A-Z0-9]+(?:\|[^>]*)?>")
+LINK_PATTERN = re.compile(r"<(?:https?|mailto):[^>]*>|https?://\S+")
+EMOJI_PATTERN = re.compile(r":[a-z0-9_+\-']+:")
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+ACKNOWLEDGEMENTS = {
+    "thanks",
+    "thank you",
+    "thanks so much",
+    "thank you so much",
+    "thx",
+    "ty",
+    "ok",
+    "okay",
+    "k",
+    "cool",
+    "great",
+    "nice",
+    "awesome",
+    "perfect",
+    "lol",
+    "haha",
+    "got it",
+    "sounds good",
+    "will do",
+    "np",
+    "no problem",
+    "yes",
+    "yep",
+    "no",
+    "nope",
+    "sure",
+    "hi",
+    "hello",
+    "hey",
+    "good morning",
+    "gm",
+}
+
+
+def _words(text: str) -> List[str]:
+    return WORD_PATTERN.findall(text.lower())
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes message text for classification caching: lowercased, with
+    mentions, links and redundant whitespace removed.
+    """
+    text = MENTION_PATTERN.sub(" ", text)
+    text = LINK_PATTERN.sub(" ", text)
+    return " ".join(text.lower().split())
+
+
+class SqliteClassificationBackend:
+    """
+    Local-file backend so that worker processes on one host share results.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS classifications "
+                "(key TEXT PRIMARY KEY, label TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._connection.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT label FROM classifications WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, label: str, ttl: float) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?)",
+                (key, label, time.time() + ttl),
+            )
+            self._connection.execute(
+                "DELETE FROM classifications WHERE expires_at <= ?", (time.time(),)
+            )
+            self._connection.commit()
+
+
+class MongoClassificationBackend:
+    """
+    Shared backend for multi-host deployments; Mongo's TTL monitor removes
+    expired documents.
+    """
+
+    def __init__(self, collection_factory: Callable[[], Any]):
+        self._collection_factory = collection_factory
+        self._collection = None
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = self._collection_factory()
+            self._collection.create_index("expires_at", expireAfterSeconds=0)
+        return self._collection
+
+    def get(self, key: str) -> Optional[str]:
+        document = self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.datetime.utcnow()}}
+        )
+        return document["label"] if document else None
+
+    def set(self, key: str, label: str, ttl: float) -> None:
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+        self.collection.update_one(
+            {"_id": key},
+            {"$set": {"label": label, "expires_at": expires_at}},
+            upsert=True,
+        )
+
+
+class ClassificationCache:
+    """
+    Memoizes classifications by normalized text and prompt version. A local
+    TTL cache sits in front of an optional shared backend.
+    """
+
+    def __init__(self, ttl: float = 86400, maxsize: int = 10000, backend=None):
+        self.ttl = ttl
+        self.backend = backend
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{PROMPT_VERSION}:{digest}"
+
+    def get(self, text: str) -> Optional[RequestType]:
+        key = self.make_key(text)
+        label = self._memory.get(key)
+        if label is None and self.backend is not None:
+            try:
+                label = self.backend.get(key)
+            except Exception as e:
+                logger.warning(f"Classification cache lookup failed: {e}")
+            if label is not None:
+                self._memory.set(key, label)
+        if label is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return RequestType(label)
+
+    def set(self, text: str, request_type: RequestType) -> None:
+        key = self.make_key(text)
+        self._memory.set(key, request_type.value)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, request_type.value, self.ttl)
+            except Exception as e:
+                logger.warning(f"Classification cache write failed: {e}")
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def rule_classify(text: str, bot_id: Optional[str] = None) -> Optional[RequestType]:
+    """
+    Resolves messages that are obviously plain conversation without a model.
+
+    :param text: Raw Slack message text.
+    :param bot_id: The bot's user id; messages mentioning only other users are conversation.
+    :return: RequestType.conversation for obvious cases, otherwise None.
+    """
+    mentions = MENTION_PATTERN.findall(text)
+    if mentions and not (bot_id and any(bot_id in mention for mention in mentions)):
+        return RequestType.conversation
+
+    stripped = EMOJI_PATTERN.sub(" ", MENTION_PATTERN.sub(" ", text))
+    words = _words(stripped)
+    if not words:
+        return RequestType.conversation
+    if " ".join(words) in ACKNOWLEDGEMENTS:
+        return RequestType.conversation
+    return None
+
+
+class SparseRows:
+    """
+    Rows of a sparse matrix in coordinate form, with just the products the
+    classifier needs, so features cost memory per token rather than per
+    vocabulary entry.
+    """
+
+    def __init__(self, rows, columns, values, shape: Tuple[int, int]):
+        self.rows = rows
+        self.columns = columns
+        self.values = values
+        self.shape = shape
+
+    def dot(self, weights):
+        """
+        Returns ``self @ weights`` for a dense ``(columns, k)`` matrix.
+        """
+        import numpy as np
+
+        contributions = self.values[:, None] * weights[self.columns]
+        return np.stack(
+            [
+                np.bincount(self.rows, weights=contributions[:, k], minlength=self.shape[0])
+                for k in range(weights.shape[1])
+            ],
+            axis=1,
+        ).astype(np.float32)
+
+    def transpose_dot(self, error):
+        """
+        Returns ``self.T @ error`` for a dense ``(rows, k)`` matrix.
+        """
+        import numpy as np
+
+        contributions = self.values[:, None] * error[self.rows]
+        return np.stack(
+            [
+                np.bincount(self.columns, weights=contributions[:, k], minlength=self.shape[1])
+                for k in range(error.shape[1])
+            ],
+            axis=1,
+        ).astype(np.float32)
+
+
+class TfidfLogisticRegression:
+    """
+    A small multinomial logistic regression over TF-IDF unigram and bigram
+    features, implemented with NumPy so it trains in-process. Features are
+    kept sparse, so memory grows with the number of tokens, not examples
+    times vocabulary.
+    """
+
+    def __init__(
+        self,
+        max_features: int = 5000,
+        epochs: int = 300,
+        learning_rate: float = 1.0,
+        l2: float = 1e-4,
+        tolerance: float = 1e-3,
+    ):
+        self.max_features = max_features
+        self.epochs = epochs
+        self.tolerance = tolerance
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.vocabulary: Dict[str, int] = {}
+        self.idf = None
+        self.classes: List[str] = []
+        self.weights = None
+        self.bias = None
+
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        words = _words(MENTION_PATTERN.sub(" ", text))
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def _transform(self, token_lists: List[List[str]]) -> SparseRows:
+        import numpy as np
+
+        rows, columns, counts = [], [], []
+        for row, tokens in enumerate(token_lists):
+            for token, count in Counter(tokens).items():
+                column = self.vocabulary.get(token)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+                    counts.append(count)
+        rows = np.array(rows, dtype=np.int64)
+        columns = np.array(columns, dtype=np.int64)
+        values = np.array(counts, dtype=np.float32) * self.idf[columns]
+        norms = np.sqrt(np.bincount(rows, weights=values**2, minlength=len(token_lists)))
+        norms[norms == 0] = 1.0
+        values = (values / norms[rows]).astype(np.float32)
+        return SparseRows(rows, columns, values, (len(token_lists), len(self.vocabulary)))
+
+    def fit(self, texts: List[str], labels: List[str]) -> "TfidfLogisticRegression":
+        import numpy as np
+
+        token_lists = [self._tokens(text) for text in texts]
+        document_frequency = Counter()
+        for tokens in token_lists:
+            document_frequency.update(set(tokens))
+        most_common = document_frequency.most_common(self.max_features)
+        self.vocabulary = {token: index for index, (token, _) in enumerate(most_common)}
+        n = len(texts)
+        self.idf = np.array(
+            [math.log((1 + n) / (1 + df)) + 1 for _, df in most_common],
+            dtype=np.float32,
+        )
+
+        features = self._transform(token_lists)
+        self.classes = sorted(set(labels))
+        targets = np.zeros((n, len(self.classes)), dtype=np.float32)
+        for row, label in enumerate(labels):
+            targets[row, self.classes.index(label)] = 1.0
+
+        self.weights = np.zeros((features.shape[1], len(self.classes)), dtype=np.float32)
+        self.bias = np.zeros(len(self.classes), dtype=np.float32)
+        previous_loss = math.inf
+        for _ in range(self.epochs):
+            probabilities = self._softmax(features.dot(self.weights) + self.bias)
+            loss = float(-np.mean(np.log(np.maximum((probabilities * targets).sum(axis=1), 1e-12))))
+            if previous_loss - loss < self.tolerance * max(loss, 1e-12):
+                break
+            previous_loss = loss
+            error = probabilities - targets
+            self.weights -= self.learning_rate * (
+                features.transpose_dot(error) / n + self.l2 * self.weights
+            )
+            self.bias -= self.learning_rate * error.mean(axis=0)
+        return self
+
+    @staticmethod
+    def _softmax(logits):
+        import numpy as np
+
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """
+        :return: The most likely label and its probability.
+        """
+        features = self._transform([self._tokens(text)])
+        probabilities = self._softmax(features.dot(self.weights) + self.bias)[0]
+        best = int(probabilities.argmax())
+        return self.classes[best], float(probabilities[best])
+
+
+def load_labelled_history(
+    path: str, max_examples: Optional[int] = None
+) -> Tuple[List[str], List[str]]:
+    """
+    Reads ``{"text", "label"}`` JSON lines, skipping labels that are not
+    RequestTypes. Only the newest ``max_examples`` examples are kept.
+    """
+    valid_labels = {request_type.value for request_type in RequestType}
+    examples = deque(maxlen=max_examples)
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("label") in valid_labels and record.get("text"):
+                examples.append((record["text"], record["label"]))
+    return [text for text, _ in examples], [label for _, label in examples]
+
+
+def build_classification_cache(
+    backend_name: str, ttl: float, path: Optional[str] = None
+) -> ClassificationCache:
+    """
+    Builds the classification cache for the configured backend name.
+    """
+    backend = None
+    if backend_name == "file" and path:
+        backend = SqliteClassificationBackend(path)
+    elif backend_name == "mongo":
+        from .database import Database
+
+        backend = MongoClassificationBackend(
+            lambda: Database.get_instance().db["classification_cache"]
+        )
+    return ClassificationCache(ttl=ttl, backend=backend)
+
+
+class RequestClassifier:
+    """
+    Classifies user requests in stages: rules, then memoized results, then a
+    local model, and only when none of those answer, the LLM. Per-stage hit
+    counts are kept in
+    ``stats``. When ``data_path`` is set, LLM decisions are appended to it as
+    labelled history and the local model is trained in the background at
+    startup from the newest ``max_examples`` of them.
+    """
+
+    min_training_examples = 50
+
+    def __init__(
+        self,
+        llm_classify: Callable[[str], Optional[RequestType]],
+        data_path: Optional[str] = None,
+        confidence_threshold: float = 0.85,
+        cache: Optional[ClassificationCache] = None,
+        max_examples: Optional[int] = 5000,
+    ):
+        self.llm_classify = llm_classify
+        self.cache = cache
+        self.data_path = data_path
+        self.confidence_threshold = confidence_threshold
+        self.model: Optional[TfidfLogisticRegression] = None
+        self.stats = Counter({"rules": 0, "cache": 0, "model": 0, "llm": 0})
+        self._lock = threading.Lock()
+        if data_path and os.path.exists(data_path):
+            # The history grows with every LLM decision, so training is capped
+            # and runs off the boot path; the LLM answers until it finishes
+            threading.Thread(
+                target=lambda: self.train(*load_labelled_history(data_path, max_examples)),
+                name="classifier-training",
+                daemon=True,
+            ).start()
+
+    def train(self, texts: List[str], labels: List[str]) -> None:
+        if len(texts) < self.min_training_examples or len(set(labels)) < 2:
+            logger.info(
+                f"Skipping local classifier training ({len(texts)} labelled examples)"
+            )
+            return
+        try:
+            self.model = TfidfLogisticRegression().fit(texts, labels)
+            logger.info(f"Trained local classifier on {len(texts)} examples")
+        except Exception as e:
+            logger.error(f"Error training local classifier: {e}")
+
+    def classify(self, text: str, bot_id: Optional[str] = None) -> Optional[RequestType]:
+        request_type = rule_classify(text, bot_id)
+        if request_type is not None:
+            self._record("rules")
+            return request_type
+
+        if self.cache is not None:
+            request_type = self.cache.get(text)
+            if request_type is not None:
+                self._record("cache")
+                return request_type
+
+        if self.model is not None:
+            label, confidence = self.model.predict(text)
+            if confidence >= self.confidence_threshold:
+                self._record("model")
+                return RequestType(label)
+
+        self._record("llm")
+        request_type = self.llm_classify(text)
+        if request_type is not None:
+            if self.cache is not None:
+                self.cache.set(text, request_type)
+            self._save_example(text, request_type)
+        return request_type
+
+    def _record(self, stage: str) -> None:
+        with self._lock:
+            self.stats[stage] += 1
+            total = sum(self.stats.values())
+        logger.debug(f"Classified by {stage}; stage hits: {dict(self.stats)} of {total}")
+        if self.cache is not None:
+            logger.debug(f"Classification cache hit ratio: {self.cache.hit_ratio():.2f}")
+
+    def hit_rates(self) -> Dict[str, float]:
+        with self._lock:
+            total = sum(self.stats.values())
+            return {
+                stage: (count / total if total else 0.0)
+                for stage, count in self.stats.items()
+            }
+
+    def _save_example(self, text: str, request_type: RequestType) -> None:
+        if not self.data_path:
+            return
+        try:
+            with self._lock, open(self.data_path, "a") as file:
+                file.write(json.dumps({"text": text, "label": request_type.value}) + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to record classification example: {e}")
@@ -0,0 +1,346 @@
+# cluster.py
+
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional
+
+from .config import (
+    CLUSTER_METRICS_INTERVAL,
+    CLUSTER_QUEUE_SIZE,
+    CLUSTER_WORKERS,
+    STATE_BACKEND,
+)
+from .logger import logger
+
+
+class ConsistentHashRing:
+    """
+    Maps keys to nodes so that each key always lands on the same node and
+    adding or removing a node only moves the keys adjacent to it.
+
+    Each node is placed on the ring ``replicas`` times to even out the load.
+    Hashes are MD5-based so every process computes the same placement.
+    """
+
+    def __init__(self, nodes: Optional[List[Hashable]] = None, replicas: int = 100):
+        self.replicas = replicas
+        self._hashes: List[int] = []
+        self._nodes: Dict[int, Hashable] = {}
+        for node in nodes or []:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    def add(self, node: Hashable) -> None:
+        for replica in range(self.replicas):
+            point = self._hash(f"{node}#{replica}")
+            if point not in self._nodes:
+                bisect.insort(self._hashes, point)
+                self._nodes[point] = node
+
+    def remove(self, node: Hashable) -> None:
+        for replica in range(self.replicas):
+            point = self._hash(f"{node}#{replica}")
+            if self._nodes.get(point) == node:
+                del self._nodes[point]
+                self._hashes.remove(point)
+
+    def node_for(self, key: Hashable) -> Hashable:
+        if not self._hashes:
+            raise LookupError("The hash ring has no nodes")
+        index = bisect.bisect(self._hashes, self._hash(repr(key))) % len(self._hashes)
+        return self._nodes[self._hashes[index]]
+
+
+def _worker_main(index: int, inbox: Any, metrics_outbox: Any) -> None:
+    """
+    Entry point of a worker process: builds its own handler, clients and
+    caches, then processes the events routed to it. Every
+    ``CLUSTER_METRICS_INTERVAL`` seconds it sends a snapshot of its metrics
+    registry to the front through ``metrics_outbox``.
+    """
+    from slack_bolt.context.say import Say
+
+    from .config import ASYNC_WORKERS, EVENT_QUEUE_SIZE, SLACK_BOT_TOKEN
+    from .database import Database
+    from .dispatcher import EventDispatcher, thread_key
+    from .extractors import start_pdf_workers
+    from .handlers.message_handler import MessageHandler
+    from .identity import identity
+    from .llm import LLMClient
+    from .metrics import registry
+    from .slack_api import GatewayWebClient, SlackClient
+
+    # Forked before any thread exists
+    start_pdf_workers()
+    web_client = GatewayWebClient(token=SLACK_BOT_TOKEN)
+    identity.resolve(web_client)
+    message_handler = MessageHandler(
+        SlackClient(web_client), LLMClient(), Database.get_instance()
+    )
+    # Threads are still ordered per (channel, thread_ts) inside the worker
+    dispatcher = EventDispatcher(num_workers=ASYNC_WORKERS, queue_size=EVENT_QUEUE_SIZE)
+
+    def publish_metrics() -> None:
+        while True:
+            time.sleep(CLUSTER_METRICS_INTERVAL)
+            try:
+                metrics_outbox.put_nowait(registry.snapshot())
+            except queue.Full:
+                # The front is behind; it only needs the latest snapshot anyway
+                pass
+
+    threading.Thread(target=publish_metrics, name="metrics-publisher", daemon=True).start()
+
+    async def run() -> None:
+        dispatcher.start()
+        while True:
+            item = await asyncio.to_thread(inbox.get)
+            if item is None:
+                break
+            event, message = item
+            await dispatcher.submit(
+                thread_key(event),
+                message_handler.process_message_event,
+                web_client,
+                event,
+                message,
+                Say(client=web_client, channel=event.get("channel")),
+            )
+        await dispatcher.stop()
+
+    logger.info(f"Cluster worker {index} started (pid {os.getpid()})")
+    asyncio.run(run())
+
+
+class WorkerPool:
+    """
+    Runs message processing in ``num_workers`` processes and routes each
+    event to one of them by consistent hashing on ``(channel, thread_ts)``.
+    Every thread therefore stays on one process, keeping its conversation,
+    summary and document caches warm there.
+    """
+
+    def __init__(self, num_workers: int = CLUSTER_WORKERS, queue_size: int = CLUSTER_QUEUE_SIZE):
+        self.num_workers = max(1, num_workers)
+        self.queue_size = queue_size
+        # Spawned so workers start without the front process's threads and sockets
+        self._context = multiprocessing.get_context("spawn")
+        self.queues: List[Any] = [None] * self.num_workers
+        self.metrics_queues: List[Any] = [None] * self.num_workers
+        self.processes: List[Optional[multiprocessing.process.BaseProcess]] = [None] * self.num_workers
+        self._snapshots: Dict[int, Any] = {}
+        self._metrics_lock = threading.Lock()
+        self.ring = ConsistentHashRing(range(self.num_workers))
+        self._stopping = threading.Event()
+
+    def _spawn(self, index: int) -> None:
+        # Every worker gets a new queue. A worker killed while blocked in get()
+        # never releases the queue's read lock, so a replacement reading the
+        # same queue would hang forever.
+        previous = self.queues[index]
+        self.queues[index] = self._context.Queue(maxsize=self.queue_size)
+        if previous is not None:
+            # Events still queued for the crashed worker are dropped: they were
+            # acked to Slack already, and the old queue cannot be drained while
+            # its read lock may be held by the dead process
+            try:
+                lost = previous.qsize()
+            except NotImplementedError:
+                lost = 0
+            if lost:
+                logger.error(f"Dropped {lost} events queued for cluster worker {index}")
+            previous.cancel_join_thread()
+            previous.close()
+        with self._metrics_lock:
+            if self.metrics_queues[index] is not None:
+                self.metrics_queues[index].close()
+            self.metrics_queues[index] = self._context.Queue(maxsize=4)
+        # Not a daemon: daemonic processes cannot start children, which the
+        # parallel PDF extractor needs. stop() shuts the workers down instead.
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self.queues[index], self.metrics_queues[index]),
+            name=f"sparrow-worker-{index}",
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self) -> None:
+        for index in range(self.num_workers):
+            self._spawn(index)
+        threading.Thread(target=self._supervise, name="worker-supervisor", daemon=True).start()
+
+    def _supervise(self) -> None:
+        # A crashed worker is restarted under the same index, so the ring never changes
+        while not self._stopping.wait(5):
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive() and not self._stopping.is_set():
+                    logger.error(
+                        f"Cluster worker {index} exited with {process.exitcode}, restarting"
+                    )
+                    self._spawn(index)
+            # Keep the metrics queues drained between scrapes
+            self.metrics_snapshots()
+
+    def submit(self, key: Hashable, event: Dict[str, Any], message: Dict[str, Any]) -> None:
+        """
+        Routes an event to its worker, blocking while that worker's queue is full.
+        """
+        index = self.ring.node_for(key)
+        start = time.monotonic()
+        while True:
+            # Re-read the queue on every attempt, since a restart replaces it
+            try:
+                self.queues[index].put((event, message), timeout=1)
+                break
+            except (queue.Full, ValueError):
+                # ValueError: the queue was closed by a restart mid-put
+                if self._stopping.is_set():
+                    logger.error(f"Cluster is stopping, dropping event for worker {index}")
+                    return
+        waited = time.monotonic() - start
+        if waited > 1:
+            logger.warning(f"Waited {waited:.1f}s for room on cluster worker {index}")
+
+    def qsize(self) -> Dict[int, int]:
+        depths = {}
+        for index, worker_queue in enumerate(self.queues):
+            try:
+                depths[index] = worker_queue.qsize()
+            except NotImplementedError:
+                depths[index] = 0
+        return depths
+
+    def metrics_snapshots(self) -> Dict[str, Any]:
+        """
+        Returns the latest metrics snapshot received from each worker, keyed by
+        worker index. A restarted worker's counters start again from zero.
+        """
+        with self._metrics_lock:
+            for index, metrics_queue in enumerate(self.metrics_queues):
+                if metrics_queue is None:
+                    continue
+                try:
+                    while True:
+                        self._snapshots[index] = metrics_queue.get_nowait()
+                except queue.Empty:
+                    pass
+            return {str(index): snapshot for index, snapshot in self._snapshots.items()}
+
+    def stop(self, timeout: float = 30) -> None:
+        self._stopping.set()
+        for worker_queue in self.queues:
+            try:
+                worker_queue.put(None, timeout=1)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Cluster worker {index} did not stop in time, terminating")
+                process.terminate()
+                process.join(5)
+
+
+def main() -> None:
+    """
+    Runs the front process: it receives Slack requests, acks them, handles
+    commands and actions itself, and routes message events to the workers.
+    """
+    from .startup import boot
+
+    import uvicorn
+    from fastapi import FastAPI, Request, Response
+    from slack_bolt import App
+    from slack_bolt.adapter.fastapi import SlackRequestHandler
+
+    from .config import SLACK_BOT_TOKEN, SLACK_SIGNING_SECRET
+    from .database import Database
+    from .dispatcher import thread_key
+    from .handlers.message_handler import MessageHandler
+    from .handlers.slack_events import register_handlers
+    from .identity import identity
+    from .llm import LLMClient
+    from .metrics import CONTENT_TYPE, registry, render_merged
+    from .slack_api import GatewayWebClient, SlackClient
+
+    boot.imports_done()
+
+    if STATE_BACKEND != "mongo":
+        logger.warning(
+            "STATE_BACKEND is not mongo; Jira prompts posted by workers will not "
+            "be found when their buttons are clicked"
+        )
+
+    with boot.phase("workers"):
+        pool = WorkerPool()
+        pool.start()
+    with boot.phase("slack_app"):
+        app = App(
+            token=SLACK_BOT_TOKEN,
+            signing_secret=SLACK_SIGNING_SECRET,
+            client=GatewayWebClient(token=SLACK_BOT_TOKEN),
+        )
+    with boot.phase("identity"):
+        identity.resolve(app.client)
+    with boot.phase("database"):
+        database = Database.get_instance()
+        database.ensure_indexes_in_background()
+    with boot.phase("message_handler"):
+        message_handler = MessageHandler(SlackClient(app.client), LLMClient(), database)
+
+    registry.gauge(
+        "sparrow_cluster_queue_depth",
+        "Events waiting for each cluster worker.",
+        ("worker",),
+        lambda: {(str(index),): depth for index, depth in pool.qsize().items()},
+    )
+
+    def handle_message(ack, body, event, message):
+        ack()
+        boot.first_event()
+        # The front sees every delivery, so its local window catches retries
+        if not message_handler.deduplicator.first_delivery(event, body.get("event_id")):
+            logger.info(f"Dropping duplicate delivery of {body.get('event_id')}")
+            return
+        pool.submit(thread_key(event), event, message)
+
+    # Everything but message events is handled in the front itself
+    register_handlers(app, message_handler, on_message=handle_message)
+
+    api = FastAPI()
+    slack_handler = SlackRequestHandler(app)
+
+    @api.post("/slack/events")
+    async def slack_events(req: Request):
+        return await slack_handler.handle(req)
+
+    @api.get("/metrics")
+    def metrics():
+        # Workers' metrics arrive as snapshots, labelled with their index
+        snapshots = {"front": registry.snapshot(), **pool.metrics_snapshots()}
+        return Response(render_merged(snapshots), media_type=CONTENT_TYPE)
+
+    port = int(os.environ.get("PORT", 3000))
+    print(f"Starting cluster front on port {port} with {pool.num_workers} workers")
+    boot.ready()
+    try:
+        uvicorn.run(api, host="0.0.0.0", port=port)
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
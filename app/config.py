@@ -19,7 +19,96 @@ GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 
 MONGODB_URI = os.environ.get("MONGODB_URI")
 MONGODB_DB = os.environ.get("MONGODB_DB")
+MONGODB_MAX_POOL_SIZE = int(os.environ.get("MONGODB_MAX_POOL_SIZE", 20))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(
+    os.environ.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 5000)
+)
+MONGODB_READ_PREFERENCE = os.environ.get("MONGODB_READ_PREFERENCE", "primaryPreferred")
 
 JIRA_API_TOKEN = os.environ.get("JIRA_API_TOKEN")
 JIRA_USERNAME = os.environ.get("JIRA_USERNAME")
 JIRA_INSTANCE_URL = os.environ.get("JIRA_INSTANCE_URL")
+
+LLM_FALLBACK_PROVIDERS = [
+    name.strip()
+    for name in os.environ.get("LLM_FALLBACK_PROVIDERS", "openai,together").split(",")
+    if name.strip()
+]
+LLM_HEDGE_DELAY = float(os.environ.get("LLM_HEDGE_DELAY", 4.0))
+LLM_REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT", 30.0))
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", 3))
+LLM_BREAKER_RESET = float(os.environ.get("LLM_BREAKER_RESET", 30.0))
+
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "True") == "True"
+STREAM_UPDATE_INTERVAL = float(os.environ.get("STREAM_UPDATE_INTERVAL", 0.7))
+
+ASYNC_WORKERS = int(os.environ.get("ASYNC_WORKERS", 8))
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", 100))
+
+FILE_CONCURRENCY = int(os.environ.get("FILE_CONCURRENCY", 4))
+IMAGE_CONCURRENCY = int(os.environ.get("IMAGE_CONCURRENCY", 4))
+AUDIO_CONCURRENCY = int(os.environ.get("AUDIO_CONCURRENCY", 2))
+TEXT_FILE_CONCURRENCY = int(os.environ.get("TEXT_FILE_CONCURRENCY", 4))
+
+FILE_CACHE_MAX_BYTES = int(os.environ.get("FILE_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+FILE_CACHE_MONGO = os.environ.get("FILE_CACHE_MONGO", "False") == "True"
+
+CLASSIFIER_DATA_PATH = os.environ.get("CLASSIFIER_DATA_PATH")
+CLASSIFIER_CONFIDENCE = float(os.environ.get("CLASSIFIER_CONFIDENCE", 0.85))
+CLASSIFIER_MAX_EXAMPLES = int(os.environ.get("CLASSIFIER_MAX_EXAMPLES", 5000))
+
+# "memory", "file" (SQLite at CLASSIFICATION_CACHE_PATH) or "mongo"
+CLASSIFICATION_CACHE_BACKEND = os.environ.get("CLASSIFICATION_CACHE_BACKEND", "memory")
+CLASSIFICATION_CACHE_PATH = os.environ.get(
+    "CLASSIFICATION_CACHE_PATH", "classification_cache.sqlite3"
+)
+CLASSIFICATION_CACHE_TTL = int(os.environ.get("CLASSIFICATION_CACHE_TTL", 86400))
+
+CONTEXT_MAX_TOKENS = int(os.environ.get("CONTEXT_MAX_TOKENS", 6000))
+CONTEXT_SUMMARY_TOKENS = int(os.environ.get("CONTEXT_SUMMARY_TOKENS", 512))
+
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+RETRIEVAL_MIN_TOKENS = int(os.environ.get("RETRIEVAL_MIN_TOKENS", 1500))
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", 5))
+
+DOWNLOAD_DIR = os.environ.get("DOWNLOAD_DIR", "/tmp/sparrow")
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", 64 * 1024))
+DOWNLOAD_TIMEOUT = float(os.environ.get("DOWNLOAD_TIMEOUT", 60.0))
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+MAX_AUDIO_BYTES = int(os.environ.get("MAX_AUDIO_BYTES", 200 * 1024 * 1024))
+MAX_TEXT_FILE_BYTES = int(os.environ.get("MAX_TEXT_FILE_BYTES", 50 * 1024 * 1024))
+
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", 1568))
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", 85))
+IMAGE_SKIP_BYTES = int(os.environ.get("IMAGE_SKIP_BYTES", 300 * 1024))
+
+# Any Whisper-compatible /audio/transcriptions endpoint, e.g. a local stand-in for tests
+WHISPER_BASE_URL = os.environ.get("WHISPER_BASE_URL")
+WHISPER_API_KEY = os.environ.get("WHISPER_API_KEY")
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "whisper-1")
+AUDIO_TRANSCRIBE_CONCURRENCY = int(os.environ.get("AUDIO_TRANSCRIBE_CONCURRENCY", 4))
+
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", 1))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 40))
+
+SLACK_MAX_RETRIES = int(os.environ.get("SLACK_MAX_RETRIES", 3))
+SLACK_RATE_BURST = int(os.environ.get("SLACK_RATE_BURST", 5))
+
+EVENT_DEDUP_WINDOW = int(os.environ.get("EVENT_DEDUP_WINDOW", 10000))
+EVENT_DEDUP_TTL = int(os.environ.get("EVENT_DEDUP_TTL", 3600))
+EVENT_DEDUP_MONGO = os.environ.get("EVENT_DEDUP_MONGO", "False") == "True"
+
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "memory")
+STATE_TTL = int(os.environ.get("STATE_TTL", 86400))
+
+CLUSTER_WORKERS = int(os.environ.get("CLUSTER_WORKERS", os.cpu_count() or 1))
+CLUSTER_QUEUE_SIZE = int(os.environ.get("CLUSTER_QUEUE_SIZE", 100))
+CLUSTER_METRICS_INTERVAL = float(os.environ.get("CLUSTER_METRICS_INTERVAL", 5))
+
+IMPORT_PROFILE = os.environ.get("IMPORT_PROFILE", "False") == "True"
+IMPORT_PROFILE_TOP = int(os.environ.get("IMPORT_PROFILE_TOP", 25))
+
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", 32))
+
+CONVERSATION_CACHE_SIZE = int(os.environ.get("CONVERSATION_CACHE_SIZE", 1000))
+CONVERSATION_CACHE_TTL = int(os.environ.get("CONVERSATION_CACHE_TTL", 3600))
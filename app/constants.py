@@ -23,3 +23,7 @@ text_file_types = [
     "yaml",
     "yml",
 ]
+
+image_file_types = ["jpg", "jpeg", "png", "webp", "gif"]
+
+audio_file_types = ["webm", "mp4", "mp3", "wav", "m4a"]
@@ -0,0 +1,296 @@
+# context.py
+
+import hashlib
+import threading
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Set
+
+from .cache import TTLCache
+from .logger import logger
+
+# Context windows of the models in LLMClient.client_model_map
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4-turbo": 128000,
+    "claude-3-haiku-20240307": 200000,
+    "llama3-70b-8192": 8192,
+    "meta-llama/Llama-3-70b-chat-hf": 8192,
+}
+
+# Approximate per-message overhead of the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Provider that writes rolling summaries
+SUMMARY_CLIENT = "groq"
+
+SUMMARY_PREFIX = "Summary of the earlier conversation in this thread:\n"
+
+
+def message_key(message: Dict[str, str]) -> str:
+    """
+    Identifies a chat message by its role and content.
+    """
+    text = f"{message.get('role')}\n{message.get('content', '')}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ApproximateEncoding:
+    """
+    Roughly four characters per token; used only if tiktoken cannot load its
+    encoding files (e.g. no network access to fetch them on first use).
+    """
+
+    chars_per_token = 4
+
+    def encode(self, text: str, **kwargs) -> List[str]:
+        step = self.chars_per_token
+        return [text[index : index + step] for index in range(0, len(text), step)]
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+class TokenCounter:
+    """
+    Counts tokens with tiktoken, falling back to cl100k_base for models
+    tiktoken does not know (e.g. Llama 3, Claude); close enough for budgeting.
+    """
+
+    def __init__(self):
+        self._encodings: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def encoding(self, model: str):
+        encoding = self._encodings.get(model)
+        if encoding is None:
+            import tiktoken
+
+            with self._lock:
+                try:
+                    try:
+                        encoding = tiktoken.encoding_for_model(model)
+                    except KeyError:
+                        encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    logger.warning(f"Falling back to approximate token counts: {e}")
+                    encoding = ApproximateEncoding()
+                self._encodings[model] = encoding
+        return encoding
+
+    def count(self, text: str, model: str) -> int:
+        return len(self.encoding(model).encode(text or "", disallowed_special=()))
+
+    def count_message(self, message: Dict[str, str], model: str) -> int:
+        return self.count(message.get("content", ""), model) + MESSAGE_OVERHEAD_TOKENS
+
+    def truncate(self, text: str, max_tokens: int, model: str) -> str:
+        encoding = self.encoding(model)
+        tokens = encoding.encode(text or "", disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[: max(0, max_tokens)]) + "\n[truncated]"
+
+
+class ContextBuilder:
+    """
+    Fits a conversation into a per-model token budget.
+
+    The system prompt and the most recent turns are kept verbatim. Older thread
+    history is replaced by a rolling summary that is cached per thread and
+    extended incrementally with only the turns that have fallen out of the
+    window since it was last updated.
+    """
+
+    def __init__(
+        self,
+        llm_client,
+        max_prompt_tokens: int = 6000,
+        completion_reserve: int = 1024,
+        summary_tokens: int = 512,
+        summary_cache: Optional[TTLCache] = None,
+    ):
+        """
+        :param llm_client: LLMClient used for model lookup and summarization.
+        :param max_prompt_tokens: Upper bound on prompt tokens regardless of model window.
+        :param completion_reserve: Tokens left free in the window for the reply.
+        :param summary_tokens: Tokens reserved for the rolling summary.
+        :param summary_cache: Cache of rolling summaries keyed by thread.
+        """
+        self.llm_client = llm_client
+        self.max_prompt_tokens = max_prompt_tokens
+        self.completion_reserve = completion_reserve
+        self.summary_tokens = summary_tokens
+        self.summaries = summary_cache or TTLCache(maxsize=1000, ttl=86400)
+        self.counter = TokenCounter()
+        self._catching_up: Set[Hashable] = set()
+        self._lock = threading.Lock()
+
+    def budget_for(self, model: str) -> int:
+        window = MODEL_CONTEXT_WINDOWS.get(model, 8192)
+        return min(self.max_prompt_tokens, window - self.completion_reserve)
+
+    def build(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: str = "",
+        client_name: str = "groq",
+        thread_key: Optional[Hashable] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Returns the messages to send, trimmed to the token budget of the model
+        behind ``client_name``.
+
+        :param messages: The current turn (file data, excerpts, user message),
+            oldest first, without the system prompt.
+        :param system_prompt: System prompt that will be prepended by LLMClient.
+        :param client_name: Provider key in ``client_model_map``.
+        :param thread_key: Identifies the thread whose rolling summary to reuse.
+            Without it, history that does not fit is dropped.
+        :param history: Earlier messages of the thread, oldest first. Only these
+            are summarized once they fall out of the window.
+        """
+        history = history or []
+        conversation = history + messages
+        if not conversation:
+            return conversation
+
+        model = self.llm_client.client_model_map[client_name]["model"]
+        budget = self.budget_for(model) - self.counter.count(system_prompt, model)
+        costs = [self.counter.count_message(message, model) for message in conversation]
+        if sum(costs) <= budget:
+            return conversation
+
+        # Keep as many of the newest turns as fit next to the summary
+        available = budget - self.summary_tokens
+        split = len(conversation)
+        used = 0
+        while split > 0 and used + costs[split - 1] <= available:
+            used += costs[split - 1]
+            split -= 1
+
+        recent = [dict(message) for message in conversation[split:]]
+        if not recent:
+            # The newest message alone is over budget, e.g. a huge pasted file
+            last = dict(conversation[-1])
+            last["content"] = self.counter.truncate(
+                last.get("content", ""), available - MESSAGE_OVERHEAD_TOKENS, model
+            )
+            recent = [last]
+            split = len(conversation) - 1
+
+        older = conversation[: min(split, len(history))]
+        if split > len(history):
+            logger.warning(
+                f"Dropping {split - len(history)} messages of the current turn "
+                "that do not fit the token budget"
+            )
+        logger.info(
+            f"Context over budget ({sum(costs)} > {budget} tokens); "
+            f"summarizing {len(older)} older messages"
+        )
+        summary = self._rolling_summary(older, thread_key) if older else None
+        if not summary:
+            return recent
+        summary = self.counter.truncate(summary, self.summary_tokens, model)
+        return [{"role": "system", "content": SUMMARY_PREFIX + summary}] + recent
+
+    def _summary_slices(
+        self, messages: List[Dict[str, str]], model: str
+    ) -> Iterator[List[Dict[str, str]]]:
+        """
+        Splits messages into slices that fit the summarizer's budget, next to
+        the previous summary. Single messages over the budget are truncated.
+        """
+        budget = self.budget_for(model) - 2 * self.summary_tokens
+        current: List[Dict[str, str]] = []
+        used = 0
+        for message in messages:
+            cost = self.counter.count_message(message, model)
+            if cost > budget:
+                message = dict(message)
+                message["content"] = self.counter.truncate(
+                    message.get("content", ""), budget - MESSAGE_OVERHEAD_TOKENS, model
+                )
+                cost = budget
+            if current and used + cost > budget:
+                yield current
+                current, used = [], 0
+            current.append(message)
+            used += cost
+        if current:
+            yield current
+
+    def _rolling_summary(
+        self, older: List[Dict[str, str]], thread_key: Optional[Hashable]
+    ) -> Optional[str]:
+        """
+        Returns the summary of ``older``, extending the cached one with the
+        messages it does not cover yet. Coverage is tracked by message identity,
+        so a refetched or edited history invalidates the summary instead of
+        misaligning it. At most one summarizer call is made on the reply path;
+        longer catch-ups run in the background and the reply uses what is cached.
+        """
+        if thread_key is None:
+            return None
+
+        keys = [message_key(message) for message in older]
+        cached = self.summaries.get(thread_key)
+        previous, covered = None, 0
+        if cached:
+            # The window may have moved either way since, so either list may be longer
+            done = cached["covered"]
+            if keys[: len(done)] == done[: len(keys)]:
+                previous, covered = cached["summary"], min(len(done), len(keys))
+
+        new_messages = older[covered:]
+        with self._lock:
+            if not new_messages or thread_key in self._catching_up:
+                return previous
+
+        # The summarizer may run on a small-context model, so a long history
+        # is folded into the summary one slice at a time
+        model = self.llm_client.client_model_map[SUMMARY_CLIENT]["model"]
+        slices = list(self._summary_slices(new_messages, model))
+        if len(slices) > 1:
+            with self._lock:
+                self._catching_up.add(thread_key)
+            threading.Thread(
+                target=self._catch_up,
+                args=(thread_key, slices, previous, keys),
+                name="summary-catch-up",
+                daemon=True,
+            ).start()
+            return previous
+
+        summary = self.llm_client.summarize_conversation(
+            slices[0], previous, client_name=SUMMARY_CLIENT
+        )
+        if summary is None:
+            return previous
+        self.summaries.set(thread_key, {"summary": summary, "covered": keys})
+        return summary
+
+    def _catch_up(
+        self,
+        thread_key: Hashable,
+        slices: List[List[Dict[str, str]]],
+        previous: Optional[str],
+        keys: List[str],
+    ) -> None:
+        covered = len(keys) - sum(len(batch) for batch in slices)
+        try:
+            for batch in slices:
+                summary = self.llm_client.summarize_conversation(
+                    batch, previous, client_name=SUMMARY_CLIENT
+                )
+                if summary is None:
+                    break
+                previous = summary
+                covered += len(batch)
+                self.summaries.set(
+                    thread_key, {"summary": summary, "covered": keys[:covered]}
+                )
+        except Exception as e:
+            logger.error(f"Error summarizing thread {thread_key}: {e}")
+        finally:
+            with self._lock:
+                self._catching_up.discard(thread_key)
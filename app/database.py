@@ -1,22 +1,162 @@
 # database.py
 
-from typing import Dict, Any, Optional
-from pymongo import MongoClient
+import threading
+from typing import Dict, Any, Optional, Union
+from pymongo import ASCENDING, MongoClient, ReturnDocument
+from pymongo.errors import ConnectionFailure, PyMongoError
 from bson import ObjectId
-from .config import MONGODB_DB, MONGODB_URI
+from .config import (
+    MONGODB_DB,
+    MONGODB_URI,
+    MONGODB_MAX_POOL_SIZE,
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+    MONGODB_READ_PREFERENCE,
+    EVENT_DEDUP_MONGO,
+    EVENT_DEDUP_TTL,
+    STATE_BACKEND,
+)
+from .logger import logger
+from .metrics import MongoCommandMetrics
+
+
+class MongoConnection:
+    """
+    Owns the single, lazily created MongoClient (and its connection pool) for
+    the process. Nothing connects to Mongo until a collection is first used.
+    """
+
+    _client: Optional[MongoClient] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_client(cls) -> MongoClient:
+        if cls._client is None:
+            with cls._lock:
+                if cls._client is None:
+                    cls._client = MongoClient(
+                        MONGODB_URI,
+                        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                        serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                        readPreference=MONGODB_READ_PREFERENCE,
+                        event_listeners=[MongoCommandMetrics()],
+                    )
+        return cls._client
+
+    @classmethod
+    def close(cls) -> None:
+        with cls._lock:
+            if cls._client is not None:
+                cls._client.close()
+                cls._client = None
+
+
+def _object_id(value: Union[str, ObjectId]) -> ObjectId:
+    return ObjectId(value) if isinstance(value, str) else value
 
 
 class Database:
-    def __init__(self):
-        self.client = MongoClient(MONGODB_URI)
-        self.db = self.client[MONGODB_DB]
-        self.threads_collection = self.db["threads"]
+    _instance: Optional["Database"] = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "Database":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @property
+    def client(self) -> MongoClient:
+        return MongoConnection.get_client()
+
+    @property
+    def db(self):
+        return self.client[MONGODB_DB]
+
+    @property
+    def threads_collection(self):
+        return self.db["threads"]
+
+    @property
+    def thread_documents_collection(self):
+        return self.db["thread_documents"]
+
+    @property
+    def users_collection(self):
+        return self.db["users"]
 
-    def create_db_thread(self, channel: str, thread_ts: str) -> ObjectId:
+    @property
+    def processed_events_collection(self):
+        return self.db["processed_events"]
+
+    @property
+    def interaction_state_collection(self):
+        return self.db["interaction_state"]
+
+    def ensure_indexes(self) -> None:
+        indexes = [
+            (
+                self.threads_collection,
+                [("channel", ASCENDING), ("thread_ts", ASCENDING)],
+                # Fails while legacy duplicate threads exist; the others still apply
+                {"unique": True, "name": "channel_thread_ts_unique"},
+            ),
+            (self.users_collection, "slack_user_id", {}),
+            (self.thread_documents_collection, "thread_id", {}),
+        ]
+        if EVENT_DEDUP_MONGO:
+            indexes.append(
+                (
+                    self.processed_events_collection,
+                    "created_at",
+                    {"expireAfterSeconds": EVENT_DEDUP_TTL},
+                )
+            )
+        if STATE_BACKEND == "mongo":
+            indexes.append(
+                (self.interaction_state_collection, "expires_at", {"expireAfterSeconds": 0})
+            )
+
+        for collection, keys, options in indexes:
+            try:
+                collection.create_index(keys, **options)
+            except ConnectionFailure as e:
+                # An unreachable server fails every index the same way
+                logger.error(f"Failed to create Mongo indexes: {e}")
+                return
+            except PyMongoError as e:
+                logger.error(f"Failed to create index {keys} on {collection.name}: {e}")
+
+    def ensure_indexes_in_background(self) -> threading.Thread:
+        """
+        Creates the indexes on a daemon thread, so boot never waits for
+        Mongo's server selection timeout.
+        """
+        thread = threading.Thread(
+            target=self.ensure_indexes, name="mongo-indexes", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def get_or_create_thread(self, channel: str, thread_ts: str) -> Dict[str, Any]:
+        """
+        Returns the thread document for ``(channel, thread_ts)``, creating it in
+        the same round-trip if it does not exist yet.
+        """
+        return self.threads_collection.find_one_and_update(
+            {"channel": channel, "thread_ts": thread_ts},
+            {"$setOnInsert": {"num_files": 0}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def create_db_thread(self, channel: str, thread_ts: str, **fields: Any):
         thread_data = {
             "channel": channel,
             "thread_ts": thread_ts,
             "num_files": 0,
+            **fields,
         }
         return self.threads_collection.insert_one(thread_data)
 
@@ -25,15 +165,41 @@ class Database:
             {"channel": channel, "thread_ts": thread_ts}
         )
 
-    def find_db_thread_by_id(self, thread_id: ObjectId) -> Optional[Dict[str, Any]]:
-        return self.threads_collection.find_one({"_id": thread_id})
+    def find_db_thread_by_id(
+        self, thread_id: Union[str, ObjectId]
+    ) -> Optional[Dict[str, Any]]:
+        return self.threads_collection.find_one({"_id": _object_id(thread_id)})
 
     def update_thread(
         self, thread: Dict[str, Any], update_data: Dict[str, Any]
     ) -> None:
-        self.threads_collection.update_one(
-            {"_id": thread["_id"]}, {"$set": update_data}
+        self.update_thread_by_id(thread["_id"], update_data)
+
+    def update_thread_by_id(
+        self, thread_id: Union[str, ObjectId], update_data: Dict[str, Any]
+    ):
+        return self.threads_collection.update_one(
+            {"_id": _object_id(thread_id)}, {"$set": update_data}
         )
 
+    def add_thread_document(
+        self, thread_id: Union[str, ObjectId], document: Dict[str, Any]
+    ) -> None:
+        thread_id = _object_id(thread_id)
+        self.thread_documents_collection.insert_one({"thread_id": thread_id, **document})
+        self.threads_collection.update_one({"_id": thread_id}, {"$inc": {"num_files": 1}})
+
+    def find_thread_documents(self, thread_id: Union[str, ObjectId]):
+        return self.thread_documents_collection.find({"thread_id": _object_id(thread_id)})
+
+    def create_user(self, slack_user_id: str, name: str, email: str):
+        return self.users_collection.insert_one(
+            {
+                "name": name,
+                "slack_user_id": slack_user_id,
+                "email": email,
+            }
+        )
 
-db = Database()
+    def get_user_information(self, slack_user_id: str) -> Optional[Dict[str, Any]]:
+        return self.users_collection.find_one({"slack_user_id": slack_user_id})
@@ -0,0 +1,82 @@
+# dedup.py
+
+import datetime
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from .cache import TTLCache
+from .logger import logger
+from .metrics import registry
+
+EVENTS_DROPPED = registry.counter(
+    "sparrow_duplicate_events_total",
+    "Slack event deliveries dropped as duplicates.",
+    ("source",),
+)
+
+
+def event_keys(event: Dict[str, Any], event_id: Optional[str] = None) -> List[str]:
+    """
+    Returns the idempotency keys of a delivery: the envelope ``event_id``,
+    which Slack reuses on retries, and the message's ``(channel, ts)``.
+    """
+    keys = []
+    if event.get("channel") and event.get("ts"):
+        keys.append(f"{event['channel']}:{event['ts']}")
+    if event_id:
+        keys.append(event_id)
+    return keys
+
+
+class EventDeduplicator:
+    """
+    Drops repeated deliveries of the same Slack event.
+
+    Every process keeps a bounded window of recently seen keys in memory.
+    When ``collection_factory`` is given, the first key of each event is also
+    inserted into a shared collection with a unique ``_id`` and a TTL index,
+    so only one process in a deployment claims each event.
+    """
+
+    def __init__(
+        self,
+        window: int = 10000,
+        ttl: float = 3600,
+        collection_factory: Optional[Callable[[], Any]] = None,
+    ):
+        self._seen = TTLCache(maxsize=window, ttl=ttl)
+        self._lock = threading.Lock()
+        self._collection_factory = collection_factory
+
+    @property
+    def shared(self) -> bool:
+        return self._collection_factory is not None
+
+    def first_delivery(self, event: Dict[str, Any], event_id: Optional[str] = None) -> bool:
+        """
+        Records the event and returns False if it has been seen before.
+        """
+        keys = event_keys(event, event_id)
+        if not keys:
+            return True
+        with self._lock:
+            if any(key in self._seen for key in keys):
+                EVENTS_DROPPED.inc(source="memory")
+                return False
+            for key in keys:
+                self._seen.set(key, True)
+
+        if self._collection_factory is not None:
+            try:
+                self._collection_factory().insert_one(
+                    {"_id": keys[0], "created_at": datetime.datetime.utcnow()}
+                )
+            except DuplicateKeyError:
+                EVENTS_DROPPED.inc(source="mongo")
+                return False
+            except PyMongoError as e:
+                # Prefer a rare double reply over dropping events while Mongo is down
+                logger.error(f"Failed to record event {keys[0]}: {e}")
+        return True
@@ -0,0 +1,102 @@
+# dispatcher.py
+
+import asyncio
+import zlib
+from typing import Any, Callable, Hashable, List, Optional
+
+from .logger import logger
+
+
+class EventDispatcher:
+    """
+    Bounded in-process work queue served by a fixed pool of async workers.
+
+    Every job carries a key (e.g. ``(channel, thread_ts)``). Jobs with the same
+    key always land on the same worker queue, so messages in one Slack thread
+    are processed in the order they arrived while different threads run
+    concurrently. Each worker queue is bounded; ``submit`` waits for room,
+    which pushes backpressure onto the event listener instead of growing
+    memory without limit.
+    """
+
+    def __init__(self, num_workers: int = 8, queue_size: int = 100):
+        """
+        :param num_workers: Number of worker tasks (and per-worker queues).
+        :param queue_size: Total queue capacity, split evenly across workers.
+        """
+        self.num_workers = max(1, num_workers)
+        self.queue_size = max(self.num_workers, queue_size)
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """
+        Creates the worker queues and tasks. Must be called from the running loop.
+        """
+        if self._workers:
+            return
+        per_worker = max(1, self.queue_size // self.num_workers)
+        self._queues = [
+            asyncio.Queue(maxsize=per_worker) for _ in range(self.num_workers)
+        ]
+        self._workers = [
+            asyncio.create_task(self._worker(index, queue))
+            for index, queue in enumerate(self._queues)
+        ]
+        logger.info(
+            f"Started {self.num_workers} event workers (queue size {self.queue_size})"
+        )
+
+    async def stop(self) -> None:
+        """
+        Waits for queued jobs to finish, then cancels the workers.
+        """
+        for queue in self._queues:
+            await queue.join()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queues = []
+
+    def _queue_for(self, key: Hashable) -> asyncio.Queue:
+        # crc32 rather than hash() so the mapping is stable across processes
+        index = zlib.crc32(repr(key).encode("utf-8")) % self.num_workers
+        return self._queues[index]
+
+    async def submit(self, key: Hashable, func: Callable, *args: Any) -> None:
+        """
+        Enqueues a job, waiting while the target worker queue is full.
+
+        :param key: Ordering key; jobs sharing a key run sequentially.
+        :param func: Blocking callable to run in a worker thread.
+        :param args: Positional arguments for ``func``.
+        """
+        if not self._workers:
+            self.start()
+        queue = self._queue_for(key)
+        if queue.full():
+            logger.warning(f"Event queue full for key {key}, applying backpressure")
+        await queue.put((func, args))
+
+    def qsize(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def _worker(self, index: int, queue: asyncio.Queue) -> None:
+        while True:
+            func, args = await queue.get()
+            try:
+                await asyncio.to_thread(func, *args)
+            except Exception as e:
+                logger.error(f"Worker {index} failed to process event: {e}")
+            finally:
+                queue.task_done()
+
+
+def thread_key(event: dict) -> Optional[tuple]:
+    """
+    Returns the ``(channel, thread_ts)`` ordering key for a Slack message event.
+    """
+    message = event.get("message") or event
+    thread_ts = message.get("thread_ts") or message.get("ts")
+    return (event.get("channel"), thread_ts)
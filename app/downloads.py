@@ -0,0 +1,143 @@
+# downloads.py
+
+import base64
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import httpx
+
+from .config import (
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_DIR,
+    DOWNLOAD_TIMEOUT,
+    MAX_AUDIO_BYTES,
+    MAX_IMAGE_BYTES,
+    MAX_TEXT_FILE_BYTES,
+)
+from .constants import audio_file_types, image_file_types
+from .logger import logger
+from .metrics import FILE_STAGE_SECONDS
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadTooLarge(DownloadError):
+    pass
+
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Returns the shared, keep-alive httpx client used for all file downloads.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    timeout=DOWNLOAD_TIMEOUT,
+                    follow_redirects=True,
+                    limits=httpx.Limits(
+                        max_connections=20, max_keepalive_connections=10
+                    ),
+                )
+    return _client
+
+
+def max_bytes_for(file_type: str) -> int:
+    """
+    Returns the download size limit for a file extension.
+    """
+    if file_type in image_file_types:
+        return MAX_IMAGE_BYTES
+    if file_type in audio_file_types:
+        return MAX_AUDIO_BYTES
+    return MAX_TEXT_FILE_BYTES
+
+
+@contextmanager
+def downloaded_file(
+    file_url: str,
+    file_type: str,
+    headers: Optional[Dict[str, str]] = None,
+    max_bytes: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Streams a URL to a uniquely named temporary file and removes it on exit.
+
+    Only one chunk is held in memory at a time, and the download is aborted as
+    soon as it exceeds ``max_bytes``.
+
+    :param file_url: URL of the file to fetch.
+    :param file_type: File extension, used for the suffix and default size limit.
+    :param headers: Extra request headers, e.g. Authorization.
+    :param max_bytes: Size limit; defaults to the limit for ``file_type``.
+    :return: Context manager yielding the path of the downloaded file.
+    """
+    limit = max_bytes if max_bytes is not None else max_bytes_for(file_type)
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    handle, file_path = tempfile.mkstemp(suffix=f".{file_type}", dir=DOWNLOAD_DIR)
+    try:
+        with os.fdopen(handle, "wb") as file, FILE_STAGE_SECONDS.time(
+            stage="download", type=file_type
+        ):
+            with get_http_client().stream("GET", file_url, headers=headers) as response:
+                if response.status_code != 200:
+                    raise DownloadError(
+                        f"Failed to download file with status code: {response.status_code}"
+                    )
+                declared = int(response.headers.get("content-length") or 0)
+                if declared > limit:
+                    raise DownloadTooLarge(f"File is {declared} bytes, limit is {limit}")
+                received = 0
+                for chunk in response.iter_bytes(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > limit:
+                        raise DownloadTooLarge(f"File exceeds the {limit} byte limit")
+                    file.write(chunk)
+        yield file_path
+    finally:
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to delete temporary file {file_path}: {e}")
+
+
+@contextmanager
+def temporary_path(suffix: str = "") -> Iterator[str]:
+    """
+    Yields a unique path in the download directory and deletes it on exit.
+    """
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    handle, file_path = tempfile.mkstemp(suffix=suffix, dir=DOWNLOAD_DIR)
+    os.close(handle)
+    try:
+        yield file_path
+    finally:
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+
+def encode_file_base64(file_path: str) -> str:
+    """
+    Base64-encodes a file in chunks, so the raw bytes are never all in memory
+    next to the encoded copy.
+    """
+    parts = []
+    chunk_size = 3 * 65536  # multiple of 3 keeps chunk encodings concatenable
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            parts.append(base64.b64encode(chunk).decode("ascii"))
+    return "".join(parts)
@@ -0,0 +1,177 @@
+# extractors.py
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .config import PDF_PARALLEL_MIN_PAGES, PDF_WORKERS
+from .logger import logger
+
+Extractor = Callable[[str], str]
+
+EXTRACTORS: Dict[str, Extractor] = {}
+
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+
+
+def register_extractor(*extensions: str) -> Callable[[Extractor], Extractor]:
+    """
+    Registers a text extractor for the given file extensions.
+    """
+
+    def decorator(func: Extractor) -> Extractor:
+        for extension in extensions:
+            EXTRACTORS[extension.lower()] = func
+        return func
+
+    return decorator
+
+
+def decode_text(data: bytes) -> str:
+    """
+    Decodes file bytes, trying UTF-8 first and detecting the charset otherwise.
+    """
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        pass
+    from charset_normalizer import from_bytes
+
+    match = from_bytes(data).best()
+    if match is None:
+        return data.decode("utf-8", errors="replace")
+    return str(match)
+
+
+@register_extractor(
+    "c", "cpp", "cs", "css", "java", "js", "json", "md", "php", "py", "rb",
+    "sh", "tex", "ts", "txt", "xml", "yaml", "yml",
+)
+def extract_plain_text(file_path: str) -> str:
+    with open(file_path, "rb") as file:
+        return decode_text(file.read())
+
+
+@register_extractor("html", "htm")
+def extract_html(file_path: str) -> str:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(extract_plain_text(file_path), "html.parser")
+    for element in soup(["script", "style"]):
+        element.decompose()
+    return soup.get_text("\n", strip=True)
+
+
+def iter_pdf_pages(file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """
+    Yields the text of each page in ``[start, stop)``, one page at a time.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    pages = reader.pages
+    stop = len(pages) if stop is None else min(stop, len(pages))
+    for index in range(start, stop):
+        yield pages[index].extract_text() or ""
+
+
+def _extract_pdf_range(page_range: Tuple[str, int, int]) -> List[str]:
+    file_path, start, stop = page_range
+    return list(iter_pdf_pages(file_path, start, stop))
+
+
+def _noop() -> None:
+    pass
+
+
+def start_pdf_workers() -> None:
+    """
+    Forks the PDF worker pool. Entry points call this at boot, before any
+    thread is started: forking a process that already runs thread pools and
+    pymongo monitors can deadlock on locks held at fork time. Spawned workers
+    are not an option since they would re-run the entry module (app.main
+    builds the Slack app at import time).
+    """
+    global _pdf_executor
+    if PDF_WORKERS <= 1 or _pdf_executor is not None:
+        return
+    _pdf_executor = ProcessPoolExecutor(
+        max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("fork")
+    )
+    # A fork pool starts all of its workers on the first submit
+    _pdf_executor.submit(_noop).result()
+    logger.info(f"Started {PDF_WORKERS} PDF extraction workers")
+
+
+def _stop_pdf_workers() -> None:
+    global _pdf_executor
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=False, cancel_futures=True)
+        _pdf_executor = None
+
+
+@register_extractor("pdf")
+def extract_pdf(file_path: str) -> str:
+    """
+    Extracts PDF text page by page. When the worker pool was started at boot,
+    documents with at least ``PDF_PARALLEL_MIN_PAGES`` pages are split into
+    page ranges and extracted in worker processes, since pypdf is pure Python
+    and bound by the GIL.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    page_count = len(reader.pages)
+    executor = _pdf_executor
+    if executor is not None and page_count >= PDF_PARALLEL_MIN_PAGES:
+        chunk = -(-page_count // PDF_WORKERS)
+        ranges = [
+            (file_path, start, min(start + chunk, page_count))
+            for start in range(0, page_count, chunk)
+        ]
+        try:
+            pages = [
+                page
+                for pages in executor.map(_extract_pdf_range, ranges)
+                for page in pages
+            ]
+        except BrokenProcessPool as e:
+            # Not re-forked mid-traffic; extraction stays sequential from here on
+            logger.warning(f"PDF worker pool failed, extracting sequentially: {e}")
+            _stop_pdf_workers()
+            pages = (page.extract_text() or "" for page in reader.pages)
+    else:
+        pages = (page.extract_text() or "" for page in reader.pages)
+    return "\n\n".join(text for text in (page.strip() for page in pages) if text)
+
+
+def extract_with_llama_index(file_path: str) -> str:
+    """
+    Falls back to llama-index readers for formats without a native extractor
+    (e.g. docx, pptx). llama-index pulls in pandas and nltk, so it is imported
+    only here.
+    """
+    from llama_index.core import SimpleDirectoryReader
+
+    documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
+    return "\n".join(document.text for document in documents)
+
+
+def extract_text(file_path: str, file_type: Optional[str] = None) -> str:
+    """
+    Extracts text from a file using the extractor registered for its type.
+
+    :param file_path: Path of the downloaded file.
+    :param file_type: Extension without the dot; defaults to the path's suffix.
+    :return: The extracted text.
+    """
+    extension = (file_type or os.path.splitext(file_path)[1].lstrip(".")).lower()
+    extractor = EXTRACTORS.get(extension)
+    if extractor is not None:
+        try:
+            return extractor(file_path).strip()
+        except Exception as e:
+            logger.warning(f"{extension} extractor failed, falling back to llama-index: {e}")
+    return extract_with_llama_index(file_path).strip()
@@ -0,0 +1,218 @@
+# formatting.py
+
+import re
+from typing import List, Optional
+
+CODE_FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+HEADING_PATTERN = re.compile(r"^\s{0,3}#{1,6}\s+(.*?)\s*#*\s*$")
+BULLET_PATTERN = re.compile(r"^(\s*)[-*+]\s+(.*)$")
+RULE_PATTERN = re.compile(r"^\s{0,3}([-*_])(\s*\1){2,}\s*$")
+QUOTE_PATTERN = re.compile(r"^(\s*>+\s?)(.*)$")
+TABLE_ROW_PATTERN = re.compile(r"^\s*\|.*\|\s*$")
+TABLE_SEPARATOR_PATTERN = re.compile(r"^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$")
+
+INLINE_CODE_PATTERN = re.compile(r"(`+)(.+?)\1")
+SLACK_TOKEN_PATTERN = re.compile(r"<(?:[@#!][^<>]*|(?:https?|mailto):[^<>]*)>")
+IMAGE_PATTERN = re.compile(r"!\[([^\]]*)\]\(([^)\s]+)(?:\s+\"[^\"]*\")?\)")
+LINK_PATTERN = re.compile(r"\[([^\]]+)\]\(([^)\s]+)(?:\s+\"[^\"]*\")?\)")
+# "__" only counts at word boundaries, and never around a bare identifier,
+# so dunder names such as __init__ survive
+BOLD_ITALIC_PATTERN = re.compile(
+    r"\*\*\*(?=\S)(.+?)(?<=\S)\*\*\*|(?<!\w)___(?=\S)(.+?)(?<=\S)___(?!\w)"
+)
+BOLD_PATTERN = re.compile(
+    r"\*\*(?=\S)(.+?)(?<=\S)\*\*|(?<!\w)__(?=\S)(.+?)(?<=\S)__(?!\w)"
+)
+IDENTIFIER_PATTERN = re.compile(r"\w+")
+ITALIC_PATTERN = re.compile(r"(?<![\w*])\*(?=\S)([^*]+?)(?<=\S)\*(?![\w*])")
+STRIKE_PATTERN = re.compile(r"~~(?=\S)(.+?)(?<=\S)~~")
+ENTITY_PATTERN = re.compile(r"&(?!(?:amp|lt|gt);)")
+
+BOLD_MARK = "\x00"
+
+
+def _escape(text: str) -> str:
+    """
+    Escapes Slack control characters while keeping Slack tokens such as
+    ``<@U123>`` and ``<https://url|text>`` intact.
+    """
+    parts = []
+    last = 0
+    for match in SLACK_TOKEN_PATTERN.finditer(text):
+        parts.append(_escape_plain(text[last : match.start()]))
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(_escape_plain(text[last:]))
+    return "".join(parts)
+
+
+def _escape_plain(text: str) -> str:
+    return ENTITY_PATTERN.sub("&amp;", text).replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _emphasized(match: re.Match) -> Optional[str]:
+    """
+    Returns the text inside a bold or bold-italic match, or None for an
+    underscore-delimited identifier that must be left as written.
+    """
+    if match.group(1) is not None:
+        return match.group(1)
+    if IDENTIFIER_PATTERN.fullmatch(match.group(2)):
+        return None
+    return match.group(2)
+
+
+def _replace_emphasis(pattern: re.Pattern, text: str, template: str) -> str:
+    def replace(match: re.Match) -> str:
+        inner = _emphasized(match)
+        return match.group(0) if inner is None else template.format(inner)
+
+    return pattern.sub(replace, text)
+
+
+def _convert_emphasis(text: str) -> str:
+    text = IMAGE_PATTERN.sub(lambda m: f"<{m.group(2)}|{m.group(1) or m.group(2)}>", text)
+    text = LINK_PATTERN.sub(lambda m: f"<{m.group(2)}|{m.group(1)}>", text)
+    text = _replace_emphasis(BOLD_ITALIC_PATTERN, text, BOLD_MARK + "_{}_" + BOLD_MARK)
+    text = _replace_emphasis(BOLD_PATTERN, text, BOLD_MARK + "{}" + BOLD_MARK)
+    text = ITALIC_PATTERN.sub(r"_\1_", text)
+    text = STRIKE_PATTERN.sub(r"~\1~", text)
+    return text.replace(BOLD_MARK, "*")
+
+
+def convert_inline(text: str) -> str:
+    """
+    Converts inline Markdown (links, bold, italics, strikethrough) to Slack
+    mrkdwn, leaving inline code spans untouched apart from escaping.
+    """
+    parts = []
+    last = 0
+    for match in INLINE_CODE_PATTERN.finditer(text):
+        parts.append(_escape(_convert_emphasis(text[last : match.start()])))
+        parts.append("`" + _escape_plain(match.group(2)) + "`")
+        last = match.end()
+    parts.append(_escape(_convert_emphasis(text[last:])))
+    return "".join(parts)
+
+
+def _split_row(row: str) -> List[str]:
+    return [cell.strip() for cell in row.strip().strip("|").split("|")]
+
+
+def format_table(rows: List[str]) -> List[str]:
+    """
+    Renders Markdown table rows as an aligned, monospaced code block, since
+    Slack has no table support.
+    """
+    cells = [_split_row(row) for row in rows if not TABLE_SEPARATOR_PATTERN.match(row)]
+    if not cells:
+        return []
+    columns = max(len(row) for row in cells)
+    cells = [row + [""] * (columns - len(row)) for row in cells]
+    widths = [max(len(row[index]) for row in cells) for index in range(columns)]
+    lines = [
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in cells
+    ]
+    return ["```"] + [_escape_plain(line) for line in lines] + ["```"]
+
+
+class MrkdwnStreamConverter:
+    """
+    Converts Markdown to Slack mrkdwn incrementally.
+
+    Text is fed in arbitrary chunks; only complete lines are converted and
+    returned, so partially streamed syntax is never rendered. Tables are held
+    back until their last row arrives. Call ``flush`` after the final chunk.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_code = False
+        self._table: List[str] = []
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        if "\n" not in self._buffer:
+            return ""
+        complete, self._buffer = self._buffer.rsplit("\n", 1)
+        lines = []
+        for line in complete.split("\n"):
+            lines.extend(self._convert_line(line))
+        return "".join(line + "\n" for line in lines)
+
+    def flush(self) -> str:
+        lines = []
+        if self._buffer:
+            lines.extend(self._convert_line(self._buffer))
+            self._buffer = ""
+        lines.extend(self._flush_table())
+        if self._in_code:
+            lines.append("```")
+            self._in_code = False
+        return "\n".join(lines)
+
+    def _flush_table(self) -> List[str]:
+        rows, self._table = self._table, []
+        return format_table(rows)
+
+    def _convert_line(self, line: str) -> List[str]:
+        if self._in_code:
+            if CODE_FENCE_PATTERN.match(line):
+                self._in_code = False
+                return ["```"]
+            return [_escape_plain(line)]
+
+        if TABLE_ROW_PATTERN.match(line) or (
+            self._table and TABLE_SEPARATOR_PATTERN.match(line)
+        ):
+            self._table.append(line)
+            return []
+        output = self._flush_table()
+
+        if CODE_FENCE_PATTERN.match(line):
+            # Slack does not understand a language after the fence
+            self._in_code = True
+            output.append("```")
+            return output
+
+        heading = HEADING_PATTERN.match(line)
+        if heading:
+            # The heading is bold already; only the italic part of *** remains
+            title = _replace_emphasis(BOLD_ITALIC_PATTERN, heading.group(1), "_{}_")
+            title = _replace_emphasis(BOLD_PATTERN, title, "{}")
+            output.append(f"*{convert_inline(title)}*")
+            return output
+
+        if RULE_PATTERN.match(line):
+            output.append("──────────")
+            return output
+
+        bullet = BULLET_PATTERN.match(line)
+        if bullet:
+            indent = len(bullet.group(1).replace("\t", "    ")) // 2
+            output.append(" " * (indent * 2) + "• " + convert_inline(bullet.group(2)))
+            return output
+
+        quote = QUOTE_PATTERN.match(line)
+        if quote:
+            output.append(">" + convert_inline(quote.group(2)))
+            return output
+
+        output.append(convert_inline(line))
+        return output
+
+
+def markdown_to_mrkdwn(text: Optional[str]) -> str:
+    """
+    Converts a complete Markdown document to Slack mrkdwn.
+
+    :param text: Markdown text, e.g. an LLM response.
+    :return: The equivalent Slack mrkdwn.
+    """
+    if not text:
+        return ""
+    converter = MrkdwnStreamConverter()
+    converted = converter.feed(text + "\n")
+    tail = converter.flush()
+    return (converted + tail).rstrip("\n")
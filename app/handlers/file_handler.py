@@ -1,17 +1,59 @@
 # file_handlers.py
 
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional, Tuple
 from slack_sdk import WebClient
-from llama_index.core import SimpleDirectoryReader
 
 from ..logger import logger
 from ..llm import LLMClient
-from ..constants import text_file_types
-from ..utils import download_and_save_file, delete_file
+from ..cache import FileContentCache
+from ..config import (
+    FILE_CACHE_MAX_BYTES,
+    FILE_CACHE_MONGO,
+    FILE_CONCURRENCY,
+    IMAGE_CONCURRENCY,
+    AUDIO_CONCURRENCY,
+    TEXT_FILE_CONCURRENCY,
+)
+from ..constants import text_file_types, image_file_types, audio_file_types
+from ..database import Database
+from ..downloads import DownloadError, downloaded_file
+from ..extractors import extract_text
+from ..images import max_dimension_for, normalize_image
+from ..metrics import FILE_STAGE_SECONDS, register_cache
+from ..utils import file_digest
+
+# Shared across handlers so that, e.g., a burst of voice memos cannot take every
+# slot and starve image descriptions in other threads.
+_type_semaphores = {
+    "image": threading.BoundedSemaphore(IMAGE_CONCURRENCY),
+    "audio": threading.BoundedSemaphore(AUDIO_CONCURRENCY),
+    "text_file": threading.BoundedSemaphore(TEXT_FILE_CONCURRENCY),
+}
+
+file_cache = FileContentCache(
+    max_bytes=FILE_CACHE_MAX_BYTES,
+    collection_factory=(lambda: Database.get_instance().db["file_cache"]) if FILE_CACHE_MONGO else None,
+)
+register_cache("file_content", file_cache.hit_ratio)
+
+
+def _upload_type(file_type: str) -> Optional[str]:
+    if file_type in image_file_types:
+        return "image"
+    if file_type in audio_file_types:
+        return "audio"
+    if file_type in text_file_types:
+        return "text_file"
+    return None
 
 
 class FileHandler:
     def __init__(self, token: str, client: WebClient, llm_client: LLMClient):
+        """
+        :param token: Bot token used to download private Slack files.
+        """
         self.token = token
         self.client = client
         self.llm_client = llm_client
@@ -20,83 +62,132 @@ class FileHandler:
         self, message: Dict[str, Any]
     ) -> Tuple[List[Dict[str, str]], bool]:
         files = message.get("files", [])
-        file_data = []
-        speech_mode = False
+        if not files:
+            return [], False
 
-        for file in files:
-            file_url, file_type, mimetype = self._share_file_and_get_url(file["id"])
-            file_content = self._process_file_content(
-                file_url, file_type, mimetype, message
+        max_workers = max(1, min(FILE_CONCURRENCY, len(files)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map() yields results in submission order, preserving file order
+            results = list(
+                executor.map(lambda file: self._process_file(file, message), files)
             )
-            if file_content:
-                file_data.append(file_content)
-                speech_mode |= file_type in ["webm", "mp4", "mp3", "wav", "m4a"]
-
-            self._revoke_file_public_access(file["id"])
 
+        file_data = [content for content in results if content]
+        speech_mode = any(content["upload_type"] == "audio" for content in file_data)
         return file_data, speech_mode
 
-    def _share_file_and_get_url(self, file_id: str) -> Tuple[str, str, str]:
-        file_info = self.client.files_info(file=file_id).data["file"]
+    def _process_file(
+        self, file: Dict[str, Any], message: Dict[str, Any]
+    ) -> Optional[Dict[str, str]]:
+        file_id = file["id"]
         try:
-            self.client.files_sharedPublicURL(token=self.token, file=file_id)
-        except:
-            logger.warning(f"Failed to share file {file_id}")
+            with FILE_STAGE_SECONDS.time(stage="file_info", type="any"):
+                file_url, file_type, mimetype = self._get_file_url(file)
+            upload_type = _upload_type(file_type)
+            semaphore = _type_semaphores.get(upload_type)
+            if semaphore is None:
+                content = self._process_file_content(
+                    file_id, file_url, file_type, mimetype, message
+                )
+            else:
+                with FILE_STAGE_SECONDS.time(stage="queue", type=upload_type):
+                    semaphore.acquire()
+                try:
+                    with FILE_STAGE_SECONDS.time(stage="total", type=upload_type):
+                        content = self._process_file_content(
+                            file_id, file_url, file_type, mimetype, message
+                        )
+                finally:
+                    semaphore.release()
+            if content:
+                content["name"] = file.get("name")
+            return content
+        except Exception as e:
+            logger.error(f"Error processing file {file_id}: {e}")
+            return None
+
+    def _get_file_url(self, file: Dict[str, Any]) -> Tuple[str, str, str]:
+        # Message events usually carry everything needed; files_info is the fallback
+        file_info = file
+        if not (file.get("url_private_download") or file.get("url_private")):
+            file_info = self.client.files_info(file=file["id"]).data["file"]
         return (
-            self._construct_file_url(file_info),
+            file_info.get("url_private_download") or file_info["url_private"],
             file_info["filetype"],
             file_info["mimetype"],
         )
 
-    def _construct_file_url(self, file_info: Dict[str, Any]) -> str:
-        public_link = file_info["permalink_public"]
-        url_private = file_info["url_private"]
-        pub_secret = public_link.split("-")[-1]
-        return f"{url_private}?pub_secret={pub_secret}"
+    def _auth_headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
 
     def _process_file_content(
-        self, file_url: str, file_type: str, mimetype: str, message: Dict[str, Any]
+        self,
+        file_id: str,
+        file_url: str,
+        file_type: str,
+        mimetype: str,
+        message: Dict[str, Any],
     ) -> Optional[Dict[str, str]]:
-        if file_type in ["jpg", "jpeg", "png", "webp", "gif"]:
-            logger.info("Processing image")
-            return {
-                "upload_type": "image",
-                "content": self.llm_client.describe_vision_anthropic(
-                    file_url, mimetype, message.get("text")
-                ),
-            }
-        elif file_type in ["webm", "mp4", "mp3", "wav", "m4a"]:
-            return {
-                "upload_type": "audio",
-                "content": self.llm_client.transcribe_audio(file_url, file_type),
-            }
-        elif file_type in text_file_types:
-            file_path = download_and_save_file(file_url, file_type)
-            if file_path:
-                text_content = self._extract_text_from_file(file_path)
-                delete_file(file_path)
-                return {
-                    "upload_type": "text_file",
-                    "content": text_content,
-                }
-        else:
+        upload_type = _upload_type(file_type)
+        if upload_type is None:
             logger.warning(f"Unsupported file type: {file_type}")
-        return None
+            return None
+
+        # Vision output depends on the user's request, so it is part of the key
+        prompt = message.get("text") if upload_type == "image" else None
+
+        digest = file_cache.digest_for(file_id)
+        if digest:
+            cached = file_cache.get(upload_type, digest, prompt)
+            if cached is not None:
+                logger.info(f"File cache hit for {file_id}")
+                return {"upload_type": upload_type, "content": cached}
+
+        try:
+            with downloaded_file(
+                file_url, file_type, headers=self._auth_headers()
+            ) as file_path:
+                with FILE_STAGE_SECONDS.time(stage="digest", type=upload_type):
+                    digest = file_digest(file_path)
+                file_cache.remember_digest(file_id, digest)
+                cached = file_cache.get(upload_type, digest, prompt)
+                if cached is not None:
+                    logger.info(f"File cache hit for {file_id} by content")
+                    return {"upload_type": upload_type, "content": cached}
+
+                with FILE_STAGE_SECONDS.time(stage="derive", type=upload_type):
+                    content = self._derive_file_content(
+                        upload_type, file_path, file_url, mimetype, prompt
+                    )
+        except DownloadError as e:
+            logger.error(f"Error downloading file {file_id}: {e}")
+            return None
+
+        if content is None:
+            return None
+        file_cache.set(upload_type, digest, content, prompt, file_id=file_id)
+        return {"upload_type": upload_type, "content": content}
+
+    def _derive_file_content(
+        self,
+        upload_type: str,
+        file_path: str,
+        file_url: str,
+        mimetype: str,
+        prompt: Optional[str],
+    ) -> Optional[str]:
+        if upload_type == "image":
+            logger.info("Processing image")
+            with FILE_STAGE_SECONDS.time(stage="normalize", type=upload_type):
+                image_data, media_type = normalize_image(
+                    file_path, max_dimension_for("anthropic")
+                )
+            return self.llm_client.describe_vision_anthropic(
+                file_url, media_type, prompt, image_data=image_data
+            )
+        elif upload_type == "audio":
+            return self.llm_client.transcribe_audio_file(file_path)
+        return self._extract_text_from_file(file_path)
 
     def _extract_text_from_file(self, file_path: str) -> str:
-        reader = SimpleDirectoryReader(input_files=[file_path])
-        documents = reader.load_data()
-        text = []
-        current_file = None
-        for doc in documents:
-            file_name = doc.metadata.get("file_name", "")
-            if current_file != file_name:
-                text.append(f"\n\nFile: {file_name}\n")
-                current_file = file_name
-            text.append(doc.text)
-
-        text_str = "\n".join(text)
-        return text_str.strip()
-
-    def _revoke_file_public_access(self, file_id: str) -> None:
-        self.client.files_revokePublicURL(token=self.token, file=file_id)
+        return extract_text(file_path)
@@ -1,16 +1,45 @@
 # handlers.py
 
-import json
-
-from ..config import SLACK_USER_TOKEN
-from ..llm import LLMClient
+from ..cache import ConversationCache
+from ..context import ContextBuilder
+from ..dedup import EventDeduplicator
+from ..state import build_state_store
+from ..retrieval import DocumentIndex
+from ..classifier import RequestClassifier, build_classification_cache
+from ..config import (
+    CONVERSATION_CACHE_SIZE,
+    CONVERSATION_CACHE_TTL,
+    CLASSIFIER_DATA_PATH,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_SUMMARY_TOKENS,
+    RETRIEVAL_MIN_TOKENS,
+    RETRIEVAL_TOP_K,
+    CLASSIFIER_CONFIDENCE,
+    CLASSIFIER_MAX_EXAMPLES,
+    CLASSIFICATION_CACHE_BACKEND,
+    CLASSIFICATION_CACHE_PATH,
+    CLASSIFICATION_CACHE_TTL,
+    STREAM_RESPONSES,
+    STREAM_UPDATE_INTERVAL,
+    EVENT_DEDUP_WINDOW,
+    EVENT_DEDUP_TTL,
+    EVENT_DEDUP_MONGO,
+    STATE_BACKEND,
+    STATE_TTL,
+)
+from ..llm import LLMClient, StreamInterrupted
 from ..models import RequestType
 from ..helpers import process_message, format_user_message, add_file_data_to_messages
 from ..database import Database
-from ..utils import add_user_message_to_messages, fetch_thread_messages
+from ..formatting import MrkdwnStreamConverter, markdown_to_mrkdwn
+from ..identity import identity
+from ..metrics import HANDLER_SECONDS, register_cache, registry, traced
+from ..pipeline import Pipeline
+from ..utils import add_user_message_to_messages, format_thread_messages
 from ..logger import logger
-from ..slack_api import SlackClient
+from ..slack_api import SlackClient, StreamingMessage
 from ..workflows.blocks.raise_issue import generate_issue_prompt_blocks
+from ..workflows.forms.onboard import create_onboarding_modal
 
 
 class MessageHandler:
@@ -18,20 +47,80 @@ class MessageHandler:
         self, slack_client: SlackClient, llm_client: LLMClient, database: Database
     ):
         self.slack_client = slack_client
-        self.slack_web_client = slack_client.client.client
-        self.bot_id = self.slack_web_client.auth_test()["user_id"]
+        self.slack_web_client = slack_client.client
         self.llm_client = llm_client
         self.database = database
-        self.ephemeral_context = {}
+        # Maps ephemeral prompt ts to the original message ts; shared across
+        # processes when STATE_BACKEND is mongo
+        self.ephemeral_context = build_state_store(
+            STATE_BACKEND, namespace="ephemeral", ttl=STATE_TTL
+        )
+        self.classifier = RequestClassifier(
+            llm_client.classify_user_request,
+            data_path=CLASSIFIER_DATA_PATH,
+            confidence_threshold=CLASSIFIER_CONFIDENCE,
+            max_examples=CLASSIFIER_MAX_EXAMPLES,
+            cache=build_classification_cache(
+                CLASSIFICATION_CACHE_BACKEND,
+                CLASSIFICATION_CACHE_TTL,
+                CLASSIFICATION_CACHE_PATH,
+            ),
+        )
+        self.context_builder = ContextBuilder(
+            llm_client,
+            max_prompt_tokens=CONTEXT_MAX_TOKENS,
+            summary_tokens=CONTEXT_SUMMARY_TOKENS,
+        )
+        self.document_index = DocumentIndex(
+            llm_client,
+            database,
+            min_tokens=RETRIEVAL_MIN_TOKENS,
+            top_k=RETRIEVAL_TOP_K,
+        )
+        self.conversation_cache = ConversationCache(
+            maxsize=CONVERSATION_CACHE_SIZE, ttl=CONVERSATION_CACHE_TTL
+        )
+        self.deduplicator = EventDeduplicator(
+            window=EVENT_DEDUP_WINDOW,
+            ttl=EVENT_DEDUP_TTL,
+            collection_factory=(lambda: database.processed_events_collection)
+            if EVENT_DEDUP_MONGO
+            else None,
+        )
+        register_cache("conversation", self.conversation_cache.hit_ratio)
+        register_cache("classification", self.classifier.cache.hit_ratio)
+        register_cache("summary", self.context_builder.summaries.hit_ratio)
+        registry.gauge(
+            "sparrow_classifier_stage_ratio",
+            "Share of requests resolved by each classifier stage.",
+            ("stage",),
+            lambda: {(stage,): rate for stage, rate in self.classifier.hit_rates().items()},
+        )
 
-    def handle_message(self, ack, client, event, message, say):
-        ack()  # Correctly await the ack() coroutine
+    @property
+    def bot_id(self):
+        return identity.user_id(self.slack_web_client)
 
+    def handle_message(self, ack, client, event, message, say, event_id=None):
+        ack()  # Correctly await the ack() coroutine
+        # Slack redelivers events it thinks we missed; ack them but do no work
+        if not self.deduplicator.first_delivery(event, event_id):
+            logger.info(f"Dropping duplicate delivery of {event_id or event.get('ts')}")
+            return
+        self.process_message_event(client, event, message, say)
+
+    @traced(HANDLER_SECONDS)
+    def process_message_event(self, client, event, message, say):
         ignore_list = ["message_deleted", "message_changed", "channel_join"]
 
-        logger.info(f"event:\n{json.dumps(event, indent=4)}")
-
         subtype = event.get("subtype")
+        logger.info(
+            f"event: type={event.get('type')} subtype={subtype} "
+            f"channel={event.get('channel')} ts={event.get('ts')}"
+        )
+
+        if subtype in ("message_deleted", "message_changed"):
+            self._invalidate_thread_cache(event)
 
         if subtype not in ignore_list:
             self._process_message(client, say, event, message, self.bot_id)
@@ -41,44 +130,118 @@ class MessageHandler:
         thread_ts = message.get("thread_ts")
         ts = message.get("ts")
 
-        thread_id = self._get_or_create_thread(message, thread_ts, ts)
+        channel = message.get("channel")
+        user_message = format_user_message(message, bot_id)
 
-        messages = []
-        if message.get("files"):
-            file_data, speech_mode = process_message(
-                SLACK_USER_TOKEN, client, message, self.llm_client
+        if thread_ts is not None:
+            self.conversation_cache.append(
+                channel, thread_ts, "user", message.get("text", "")
             )
-            messages = add_file_data_to_messages(messages, file_data)
 
-        user_message = format_user_message(message, bot_id)
-        messages = add_user_message_to_messages(messages, user_message)
+        pipeline = Pipeline(name="message")
+        pipeline.add(
+            "thread", lambda: self._get_or_create_thread(message, thread_ts, ts)
+        )
+        pipeline.add("files", lambda: self._process_files(client, message))
+        pipeline.add("index", self._index_files, depends_on=("thread", "files"))
+        if bot_mention:
+            pipeline.add(
+                "excerpts",
+                lambda thread, index: self.document_index.retrieve(thread, user_message),
+                depends_on=("thread", "index"),
+            )
+        elif thread_ts is not None:
+            pipeline.add(
+                "history", lambda: self._get_thread_history(thread_ts, channel)
+            )
+            # Retrieval embeds the query, so it waits until the bot is known to reply
+            pipeline.add(
+                "excerpts",
+                lambda thread, index, history: self.document_index.retrieve(
+                    thread, user_message
+                )
+                if history["bot_in_thread"]
+                else [],
+                depends_on=("thread", "index", "history"),
+            )
+        if not bot_mention and thread_ts is None:
+            pipeline.add(
+                "classification", lambda: self._classify_request(event["text"])
+            )
+        results = pipeline.run()
+
+        messages = add_file_data_to_messages([], results["index"])
 
         if bot_mention:
             logger.info("Handling direct message")
+            messages = self._add_document_excerpts(messages, results["excerpts"])
+            messages = add_user_message_to_messages(messages, user_message)
             self._handle_direct_message(client, say, event, messages)
         elif thread_ts is not None:
-            if self._bot_already_in_thread(thread_ts, message.get("channel")):
+            if results["history"]["bot_in_thread"]:
                 logger.info("Handling thread message")
+                messages = self._add_document_excerpts(messages, results["excerpts"])
+                messages = add_user_message_to_messages(messages, user_message)
                 self._handle_thread_message(client, say, event, messages)
         else:
-            request_type = self._classify_request(event["text"])
+            request_type = results["classification"]
             logger.info(f"request_type: {request_type}")
             self._handle_request(request_type, client, say, event, message, bot_id)
 
+    def _process_files(self, client, message):
+        if not message.get("files"):
+            return []
+        file_data, speech_mode = process_message(
+            client.token, client, message, self.llm_client
+        )
+        return file_data
+
+    def _index_files(self, thread, files):
+        if not files:
+            return files
+        file_data, indexed = self.document_index.index_large_files(
+            thread["_id"], files
+        )
+        thread["num_files"] = thread.get("num_files", 0) + indexed
+        return file_data
+
+    def _add_document_excerpts(self, messages, excerpts):
+        if excerpts:
+            messages.append(
+                {
+                    "role": "user",
+                    "content": "Relevant excerpts from uploaded documents:\n"
+                    + "\n---\n".join(excerpts),
+                }
+            )
+        return messages
+
     def _handle_direct_message(self, client, say, event, messages):
-        response = self.llm_client.llm_response(messages)
-        logger.info(f"Direct Message:\n{json.dumps(messages, indent=4)}")
-        self._send_response(response, client, say, event)
+        logger.info(f"Direct message with {len(messages)} messages")
+        self._respond(messages, client, say, event)
 
     def _handle_thread_message(self, client, say, event, messages):
-        thread_messages = fetch_thread_messages(client, event)
-        messages = thread_messages + messages
-        logger.info(f"Thread Messages:\n{json.dumps(messages, indent=4)}")
-        response = self.llm_client.llm_response(messages)
-        self._send_response(response, client, say, event)
+        thread = self._get_thread_history(event["thread_ts"], event["channel"])
+        history = thread["messages"]
+        logger.info(f"Thread message with {len(history) + len(messages)} messages")
+        self._respond(messages, client, say, event, history=history)
+
+    def _respond(self, messages, client, say, event, history=None):
+        thread_ts = event.get("thread_ts") or event.get("ts")
+        messages = self.context_builder.build(
+            messages,
+            system_prompt=self.llm_client.system_prompt_map["conversation"],
+            thread_key=(event.get("channel"), thread_ts),
+            history=history,
+        )
+        if STREAM_RESPONSES:
+            self._stream_response(messages, client, event)
+        else:
+            response = self.llm_client.llm_response(messages)
+            self._send_response(response, client, say, event)
 
     def _classify_request(self, text: str) -> RequestType:
-        request_type = self.llm_client.classify_user_request(text)
+        request_type = self.classifier.classify(text, self.bot_id)
         return request_type
 
     def _handle_request(self, request_type, client, say, event, message, bot_id):
@@ -92,26 +255,13 @@ class MessageHandler:
 
     def _get_or_create_thread(self, message, thread_ts, ts):
         thread_ts = thread_ts or ts
-        thread_id = self.database.find_db_thread(message.get("channel"), thread_ts)
-
-        if not thread_id:
-            insert_result = self.database.create_db_thread(
-                message.get("channel"), thread_ts
-            )
-            thread_id = insert_result.inserted_id
-            logger.debug("Thread not found, created new thread")
-        else:
-            thread_id = thread_id.get("_id")
-            logger.debug("Found existing thread")
-
-        return thread_id
+        return self.database.get_or_create_thread(message.get("channel"), thread_ts)
 
     def _handle_pm_request(self, client, say, event, message, bot_id):
         user_id = message["user"]
         channel_id = message["channel"]
         message_ts = message["ts"]
         blocks = generate_issue_prompt_blocks()
-        self.ephemeral_context[message_ts] = message_ts
 
         response = client.chat_postEphemeral(
             channel=channel_id,
@@ -121,8 +271,9 @@ class MessageHandler:
         )
 
         ephemeral_id = response["message_ts"]
-        self.ephemeral_context[ephemeral_id] = message_ts
+        self.ephemeral_context.set(ephemeral_id, message_ts)
 
+    @traced(HANDLER_SECONDS)
     def handle_create_jira_yes(self, ack, body, client, respond):
         ack()
 
@@ -142,6 +293,7 @@ class MessageHandler:
             delete_original=True,
         )
 
+    @traced(HANDLER_SECONDS)
     def handle_create_jira_no(self, ack, body, client, say, respond):
         ack()
 
@@ -151,6 +303,32 @@ class MessageHandler:
             delete_original=True,
         )
 
+    @traced(HANDLER_SECONDS)
+    def handle_onboarding_modal_open(self, ack, body, client):
+        ack()
+        client.views_open(trigger_id=body["trigger_id"], view=create_onboarding_modal())
+
+    @traced(HANDLER_SECONDS)
+    def handle_onboarding_modal_submit(self, ack, body, view):
+        ack()
+        # Input block ids are generated, so values are looked up by action id
+        values = {
+            action_id: element.get("value")
+            for block in view["state"]["values"].values()
+            for action_id, element in block.items()
+        }
+        user_id = body["user"]["id"]
+        logger.info(
+            f"Onboarding submitted by {user_id}: "
+            f"{values.get('customer_name')} ({values.get('company_name')})"
+        )
+        if self.database.get_user_information(user_id) is None:
+            profile = self.slack_web_client.users_info(user=user_id)["user"]["profile"]
+            self.database.create_user(
+                user_id, values.get("customer_name"), profile.get("email")
+            )
+
+    @traced(HANDLER_SECONDS)
     def handle_reaction_added(self, ack, client, event):
         ack()
         logger.debug(f"Reaction added event: {event}")
@@ -159,6 +337,7 @@ class MessageHandler:
         if reaction_name == "ebl":
             logger.info("EBL reaction added")
 
+    @traced(HANDLER_SECONDS)
     def handle_sparrow(self, ack, client, respond, command):
         ack()
         request = command.get("text")
@@ -167,16 +346,59 @@ class MessageHandler:
 
     def _send_response(self, ai_response, client, say, event):
         thread_ts = event.get("thread_ts") or event.get("ts")
+        text = markdown_to_mrkdwn(ai_response.content)
         say(
-            text=ai_response.content,
+            text=text,
             thread_ts=thread_ts,
         )
+        self.conversation_cache.append(
+            event.get("channel"), thread_ts, "assistant", text
+        )
 
-    def _bot_already_in_thread(self, thread_ts, channel):
-        replies = self.slack_web_client.conversations_replies(
-            channel=channel, ts=thread_ts
+    def _stream_response(self, messages, client, event):
+        thread_ts = event.get("thread_ts") or event.get("ts")
+        streamed = StreamingMessage(
+            client,
+            channel=event.get("channel"),
+            thread_ts=thread_ts,
+            interval=STREAM_UPDATE_INTERVAL,
         )
-        for message in replies["messages"]:
-            if message.get("user") == self.bot_id:
-                return True
-        return False
+        streamed.start()
+        converter = MrkdwnStreamConverter()
+        try:
+            for delta in self.llm_client.stream_llm_response(messages):
+                streamed.append(converter.feed(delta))
+        except StreamInterrupted:
+            # Keep the partial text visible but out of the conversation cache
+            streamed.append(converter.flush())
+            streamed.finish(f"{streamed.text}\n\n_(response interrupted)_")
+            return
+        streamed.append(converter.flush())
+        if not streamed.text:
+            streamed.finish("Sorry, I couldn't come up with a response. Please try again.")
+            return
+        content = streamed.finish()
+        self.conversation_cache.append(
+            event.get("channel"), thread_ts, "assistant", content
+        )
+
+    def _get_thread_history(self, thread_ts, channel):
+        thread = self.conversation_cache.get(channel, thread_ts)
+        if thread is None:
+            logger.debug("Conversation cache miss, fetching thread history")
+            replies = self.slack_web_client.conversations_replies(
+                channel=channel, ts=thread_ts
+            )
+            thread = self.conversation_cache.load(
+                channel,
+                thread_ts,
+                format_thread_messages(replies["messages"], self.bot_id),
+                any(msg.get("user") == self.bot_id for msg in replies["messages"]),
+            )
+        return thread
+
+    def _invalidate_thread_cache(self, event):
+        message = event.get("message") or event.get("previous_message") or {}
+        thread_ts = message.get("thread_ts")
+        if thread_ts:
+            self.conversation_cache.invalidate(event.get("channel"), thread_ts)
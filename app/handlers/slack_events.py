@@ -0,0 +1,68 @@
+# slack_events.py
+
+from typing import Callable, Optional
+
+from slack_bolt import App
+
+from ..slack_api import GatewayWebClient
+from ..startup import boot
+from .message_handler import MessageHandler
+
+
+def register_handlers(
+    app: App, message_handler: MessageHandler, on_message: Optional[Callable] = None
+) -> None:
+    """
+    Registers the Slack listeners shared by the sync entrypoints.
+
+    :param app: Bolt app to register the listeners on.
+    :param message_handler: Handler doing the work for each listener.
+    :param on_message: Replacement ``message`` listener, e.g. the cluster
+        front's, which routes events to worker processes.
+    """
+
+    @app.middleware
+    def instrument_client(context, next):
+        # Bolt builds a plain WebClient per request; route it through the gateway
+        context["client"] = GatewayWebClient.from_client(context.client)
+        next()
+
+    @app.event("url_verification")
+    def handle_url_verification(ack, body):
+        challenge = body.get("challenge")
+        ack(challenge)
+
+    def handle_message(ack, body, client, event, message, say):
+        boot.first_event()
+        message_handler.handle_message(
+            ack, client, event, message, say, event_id=body.get("event_id")
+        )
+
+    app.event("message")(on_message or handle_message)
+
+    @app.event("reaction_added")
+    def handle_reaction_added(ack, client, event):
+        message_handler.handle_reaction_added(ack, client, event)
+
+    # Command handlers
+    @app.command("/sparrow")
+    def handle_sparrow(ack, client, respond, command):
+        message_handler.handle_sparrow(ack, client, respond, command)
+
+    # Action handlers
+    @app.action("start_onboarding")
+    def handle_onboarding_modal_open(ack, body, client):
+        message_handler.handle_onboarding_modal_open(ack, body, client)
+
+    @app.action("create_jira_yes")
+    def handle_create_jira_yes(ack, body, client, respond):
+        message_handler.handle_create_jira_yes(ack, body, client, respond)
+
+    @app.action("create_jira_no")
+    def handle_create_jira_no(ack, body, client, say, respond):
+        message_handler.handle_create_jira_no(ack, body, client, say, respond)
+
+    # View handlers
+    @app.view("onboarding_modal")
+    def handle_onboarding_modal_submit(ack, body, view):
+        message_handler.handle_onboarding_modal_submit(ack, body, view)
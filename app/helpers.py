@@ -4,9 +4,7 @@ from typing import Any, Dict, List, Optional, Tuple
 from slack_sdk import WebClient
 from .logger import logger
 from .llm import LLMClient
-from .database import Database, db
 from .constants import text_file_types
-from .utils import get_file_data, save_file, download_and_save_file
 from .handlers.file_handler import FileHandler
 
 
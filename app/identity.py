@@ -0,0 +1,63 @@
+# identity.py
+
+import threading
+from typing import Optional
+from pydantic import BaseModel
+
+from .logger import logger
+
+
+class BotIdentity(BaseModel):
+    user_id: str
+    bot_id: Optional[str] = None
+    team_id: Optional[str] = None
+
+
+class IdentityRegistry:
+    """
+    Process-wide cache of the bot's Slack identity.
+
+    ``auth_test`` is called once per token; if the client's token changes
+    (token rotation) or ``invalidate`` is called after an auth error, the
+    identity is resolved again on next use.
+    """
+
+    def __init__(self):
+        self._identity: Optional[BotIdentity] = None
+        self._token: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def resolve(self, client) -> BotIdentity:
+        """
+        Returns the bot identity, calling ``auth_test`` only when needed.
+
+        :param client: Slack WebClient used to resolve the identity.
+        :return: The cached BotIdentity.
+        """
+        token = getattr(client, "token", None)
+        identity = self._identity
+        if identity is not None and token == self._token:
+            return identity
+
+        with self._lock:
+            if self._identity is None or token != self._token:
+                response = client.auth_test()
+                self._identity = BotIdentity(
+                    user_id=response["user_id"],
+                    bot_id=response.get("bot_id"),
+                    team_id=response.get("team_id"),
+                )
+                self._token = token
+                logger.info(f"Resolved bot identity: {self._identity.user_id}")
+            return self._identity
+
+    def user_id(self, client) -> str:
+        return self.resolve(client).user_id
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._identity = None
+            self._token = None
+
+
+identity = IdentityRegistry()
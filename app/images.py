@@ -0,0 +1,106 @@
+# images.py
+
+import base64
+import io
+import os
+from typing import Tuple
+
+from .config import IMAGE_MAX_DIMENSION, IMAGE_QUALITY, IMAGE_SKIP_BYTES
+from .downloads import encode_file_base64
+from .logger import logger
+
+# Longest edge each vision model actually uses; larger images are downscaled server-side
+MODEL_MAX_DIMENSIONS = {
+    "anthropic": 1568,
+    "openai": 2048,
+}
+
+# Claude resizes anything above ~1.15 megapixels, so larger payloads are wasted
+MAX_PIXELS = 1_150_000
+
+def max_dimension_for(provider: str) -> int:
+    """
+    Longest edge to send to ``provider``: the configured ``IMAGE_MAX_DIMENSION``,
+    but never more than the model will actually use.
+    """
+    return min(IMAGE_MAX_DIMENSION, MODEL_MAX_DIMENSIONS.get(provider, IMAGE_MAX_DIMENSION))
+
+
+SUPPORTED_MEDIA_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+
+
+def normalize_image(
+    file_path: str,
+    max_dimension: int = IMAGE_MAX_DIMENSION,
+    quality: int = IMAGE_QUALITY,
+    skip_bytes: int = IMAGE_SKIP_BYTES,
+) -> Tuple[str, str]:
+    """
+    Prepares an image for a vision model: applies EXIF orientation, downscales
+    to the model's effective resolution, drops metadata and re-encodes as JPEG
+    (or WebP when there is transparency). Images that are already small, in a
+    supported format and free of EXIF data are sent unchanged.
+
+    :param file_path: Path to the downloaded image.
+    :param max_dimension: Longest edge in pixels after resizing.
+    :param quality: JPEG/WebP quality.
+    :param skip_bytes: Files at or below this size are not re-encoded if they fit.
+    :return: Base64 encoded image data and its media type.
+    """
+    from PIL import Image, ImageOps
+
+    original_size = os.path.getsize(file_path)
+    with Image.open(file_path) as image:
+        width, height = image.size
+        fits = max(width, height) <= max_dimension and width * height <= MAX_PIXELS
+        original_media_type = SUPPORTED_MEDIA_TYPES.get(image.format)
+        # Files carrying EXIF (location, orientation) are always re-encoded
+        reusable = fits and original_media_type and not image.getexif()
+        if reusable and original_size <= skip_bytes:
+            return encode_file_base64(file_path), original_media_type
+
+        # Animated images only contribute their first frame
+        image.seek(0)
+        image = ImageOps.exif_transpose(image)
+        # Orientation may have swapped the dimensions
+        width, height = image.size
+        scale = min(
+            1.0,
+            max_dimension / max(width, height),
+            (MAX_PIXELS / (width * height)) ** 0.5,
+        )
+        if scale < 1.0:
+            image = image.resize(
+                (max(1, int(width * scale)), max(1, int(height * scale))),
+                Image.LANCZOS,
+            )
+
+        output_width, output_height = image.size
+        has_alpha = image.mode in ("RGBA", "LA") or (
+            image.mode == "P" and "transparency" in image.info
+        )
+        output = io.BytesIO()
+        if has_alpha:
+            image.convert("RGBA").save(output, format="WEBP", quality=quality, method=4)
+            media_type = "image/webp"
+        else:
+            image.convert("RGB").save(
+                output, format="JPEG", quality=quality, optimize=True, progressive=True
+            )
+            media_type = "image/jpeg"
+
+    data = output.getvalue()
+    if len(data) >= original_size and reusable:
+        # Re-encoding did not help; keep the original bytes
+        return encode_file_base64(file_path), original_media_type
+
+    logger.info(
+        f"Normalized image {width}x{height} to {output_width}x{output_height}, "
+        f"{original_size} to {len(data)} bytes"
+    )
+    return base64.b64encode(data).decode("ascii"), media_type
@@ -1,63 +1,150 @@
 # llm.py
 
-from typing import List, Dict, Any, Optional
+import time
+from functools import cached_property
+from typing import List, Dict, Any, Callable, Iterator, Mapping, NamedTuple, Optional
 from .models import AIResponse, RequestType
-from .prompts import general, project_manager, classify_request, formatting_prompt
-from .utils import (
-    get_file_data,
-    save_file,
-    delete_file,
-    fetch_and_format_thread_messages,
-)
+from .prompts import general, project_manager, classify_request, summarize_conversation
+from .formatting import markdown_to_mrkdwn
+from .audio import transcribe_in_segments
+from .downloads import downloaded_file
+from .images import max_dimension_for, normalize_image
 from .logger import logger
-from .config import OPENAI_API_KEY, ANTHROPIC_API_KEY, GROQ_API_KEY, TOGETHER_API_KEY
+from .metrics import (
+    LLM_FIRST_TOKEN_SECONDS,
+    LLM_METHOD_SECONDS,
+    LLM_REQUEST_SECONDS,
+    record_usage,
+    registry,
+    traced,
+)
+from .router import ProviderRouter
+from .config import (
+    OPENAI_API_KEY,
+    ANTHROPIC_API_KEY,
+    GROQ_API_KEY,
+    TOGETHER_API_KEY,
+    LLM_FALLBACK_PROVIDERS,
+    LLM_HEDGE_DELAY,
+    LLM_REQUEST_TIMEOUT,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RESET,
+    EMBEDDING_MODEL,
+    WHISPER_BASE_URL,
+    WHISPER_API_KEY,
+    WHISPER_MODEL,
+    AUDIO_TRANSCRIBE_CONCURRENCY,
+)
+
+
+class LazyProvider(Mapping):
+    """
+    A ``client_model_map`` entry. The model name is available immediately,
+    while the SDK client and instructor wrapper are built on first lookup.
+    """
+
+    def __init__(
+        self, model: str, chat: Callable[[], Any], instructor: Callable[[], Any]
+    ):
+        self._model = model
+        self._factories = {"chat": chat, "instructor": instructor}
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "model":
+            return self._model
+        return self._factories[key]()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(("instructor", "chat", "model"))
+
+    def __len__(self) -> int:
+        return 3
 
-import instructor
-from openai import OpenAI
-from anthropic import Anthropic
-from groq import Groq
+
+class OpenedStream(NamedTuple):
+    """
+    A provider stream that has produced its first text delta.
+    """
+
+    provider: str
+    model: str
+    stream: Any
+    chunks: Iterator[Any]
+    first: str
+    started: float
+
+
+class StreamInterrupted(Exception):
+    """
+    Raised by ``stream_llm_response`` when a provider stream fails after
+    text has already been yielded.
+    """
+
+    def __init__(self, provider: str):
+        super().__init__(f"{provider} stream ended early")
+        self.provider = provider
+
+
+def _close_stream(stream: Any) -> None:
+    close = getattr(stream, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception as e:
+            logger.debug(f"Failed to close LLM stream: {e}")
 
 
 class LLMClient:
     def __init__(self):
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
-        self.anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
-        self.groq_client = Groq(api_key=GROQ_API_KEY)
-        self.together_client = OpenAI(
-            api_key=TOGETHER_API_KEY, base_url="https://api.together.xyz/v1"
-        )
+        # Provider SDKs and instructor take around a second to import, so they
+        # are only imported and constructed when a provider is first used.
+        self.client_model_map = {
+            "openai": LazyProvider(
+                "gpt-4-turbo",
+                chat=lambda: self.openai_client,
+                instructor=lambda: self.openai_instructor,
+            ),
+            "anthropic": LazyProvider(
+                "claude-3-haiku-20240307",
+                chat=lambda: self.anthropic_client,
+                instructor=lambda: self.anthropic_instructor,
+            ),
+            "groq": LazyProvider(
+                "llama3-70b-8192",
+                chat=lambda: self.groq_client,
+                instructor=lambda: self.groq_instructor,
+            ),
+            "together": LazyProvider(
+                "meta-llama/Llama-3-70b-chat-hf",
+                chat=lambda: self.together_client,
+                instructor=lambda: self.together_instructor,
+            ),
+        }
 
-        self.openai_instructor = instructor.from_openai(self.openai_client)
-        self.anthropic_instructor = instructor.from_anthropic(self.anthropic_client)
-        self.groq_instructor = instructor.from_groq(
-            self.groq_client, mode=instructor.Mode.JSON
+        self.router = ProviderRouter(
+            hedge_delay=LLM_HEDGE_DELAY,
+            timeout=LLM_REQUEST_TIMEOUT,
+            failure_threshold=LLM_BREAKER_FAILURES,
+            reset_timeout=LLM_BREAKER_RESET,
         )
-        self.together_instructor = instructor.from_openai(
-            self.together_client, mode=instructor.Mode.MD_JSON
-        )
-
-        self.client_model_map = {
-            "openai": {
-                "instructor": self.openai_instructor,
-                "chat": self.openai_client,
-                "model": "gpt-4-turbo",
-            },
-            "anthropic": {
-                "instructor": self.anthropic_instructor,
-                "chat": self.anthropic_client,
-                "model": "claude-3-haiku-20240307",
+        registry.gauge(
+            "sparrow_llm_provider_p95_seconds",
+            "Rolling p95 latency per provider, as seen by the router.",
+            ("provider",),
+            lambda: {
+                (provider,): stats["p95"] or 0.0
+                for provider, stats in self.router.snapshot().items()
             },
-            "groq": {
-                "instructor": self.groq_instructor,
-                "chat": self.groq_client,
-                "model": "llama3-70b-8192",
-            },
-            "together": {
-                "instructor": self.together_instructor,
-                "chat": self.together_client,
-                "model": "meta-llama/Llama-3-70b-chat-hf",
+        )
+        registry.gauge(
+            "sparrow_llm_provider_error_rate",
+            "Rolling error rate per provider, as seen by the router.",
+            ("provider",),
+            lambda: {
+                (provider,): stats["error_rate"]
+                for provider, stats in self.router.snapshot().items()
             },
-        }
+        )
 
         self.system_prompt_map = {
             "feature_request": project_manager,
@@ -67,6 +154,65 @@ class LLMClient:
             "ai_conversation": general,
         }
 
+    @cached_property
+    def openai_client(self) -> Any:
+        from openai import OpenAI
+
+        return OpenAI(api_key=OPENAI_API_KEY)
+
+    @cached_property
+    def anthropic_client(self) -> Any:
+        from anthropic import Anthropic
+
+        return Anthropic(api_key=ANTHROPIC_API_KEY)
+
+    @cached_property
+    def groq_client(self) -> Any:
+        from groq import Groq
+
+        return Groq(api_key=GROQ_API_KEY)
+
+    @cached_property
+    def together_client(self) -> Any:
+        from openai import OpenAI
+
+        return OpenAI(api_key=TOGETHER_API_KEY, base_url="https://api.together.xyz/v1")
+
+    @cached_property
+    def whisper_client(self) -> Any:
+        if not WHISPER_BASE_URL:
+            return self.openai_client
+        from openai import OpenAI
+
+        return OpenAI(
+            api_key=WHISPER_API_KEY or OPENAI_API_KEY or "local",
+            base_url=WHISPER_BASE_URL,
+        )
+
+    @cached_property
+    def openai_instructor(self) -> Any:
+        import instructor
+
+        return instructor.from_openai(self.openai_client)
+
+    @cached_property
+    def anthropic_instructor(self) -> Any:
+        import instructor
+
+        return instructor.from_anthropic(self.anthropic_client)
+
+    @cached_property
+    def groq_instructor(self) -> Any:
+        import instructor
+
+        return instructor.from_groq(self.groq_client, mode=instructor.Mode.JSON)
+
+    @cached_property
+    def together_instructor(self) -> Any:
+        import instructor
+
+        return instructor.from_openai(self.together_client, mode=instructor.Mode.MD_JSON)
+
     def upload_file(self, file_url: str) -> Any:
         return self.openai_client.files.create(
             file=open(file_url, "rb"), purpose="assistants"
@@ -131,6 +277,7 @@ class LLMClient:
             thread_id=thread_id, run_id=run_id
         )
 
+    @traced(LLM_METHOD_SECONDS)
     def classify_user_request(
         self, message: str, client_name: str = "groq"
     ) -> Optional[RequestType]:
@@ -141,11 +288,16 @@ class LLMClient:
                 {"role": "system", "content": classify_request},
                 {"role": "user", "content": message},
             ]
-            response = client.create(
-                model=model,
-                messages=messages,
-                response_model=RequestType,
-            )
+            with LLM_REQUEST_SECONDS.time(
+                provider=client_name, model=model, mode="structured"
+            ):
+                response = client.create(
+                    model=model,
+                    messages=messages,
+                    response_model=RequestType,
+                )
+            raw_response = getattr(response, "_raw_response", None)
+            record_usage(client_name, model, getattr(raw_response, "usage", None))
             return response
         except Exception as e:
             logger.error(f"Error classifying user request: {e}")
@@ -157,21 +309,25 @@ class LLMClient:
         temperature: float,
         client: Any,
         model: str,
+        provider: str = "unknown",
     ) -> Optional[AIResponse]:
         try:
-            logger.info(f"Generating LLM response with {client}")
+            logger.info(f"Generating LLM response with {provider}")
             # formatted_messages = fetch_and_format_thread_messages(messages)
-            response = client.chat.completions.create(
-                model=model,
-                temperature=temperature,
-                messages=messages,
-            )
-            logger.info(f"Response: {response}")
+            with LLM_REQUEST_SECONDS.time(provider=provider, model=model, mode="chat"):
+                response = client.chat.completions.create(
+                    model=model,
+                    temperature=temperature,
+                    messages=messages,
+                    timeout=LLM_REQUEST_TIMEOUT,
+                )
+            record_usage(provider, model, getattr(response, "usage", None))
             return AIResponse(content=response.choices[0].message.content)
         except Exception as e:
             logger.error(f"Error generating LLM response: {e}")
             return None
 
+    @traced(LLM_METHOD_SECONDS)
     def llm_response(
         self,
         messages: List[Dict[str, str]],
@@ -181,55 +337,157 @@ class LLMClient:
         retry_count: int = 1,
         structured: bool = False,
     ) -> Optional[AIResponse]:
-        model = self.client_model_map[client_name]["model"]
         request_type_value = request_type.value
         system_prompt = self.system_prompt_map[request_type_value]
         full_messages = [
             {"role": "system", "content": system_prompt},
             *messages,
         ]
-        attempt = 0
 
-        while attempt <= retry_count:
+        def complete(provider: str) -> Optional[AIResponse]:
+            model = self.client_model_map[provider]["model"]
             if structured:
-                client = self.client_model_map[client_name]["instructor"]
-                response = client.create(
-                    model=model,
-                    temperature=temperature,
-                    messages=full_messages,
-                    response_model=AIResponse,
-                )
-            else:
-                client = self.client_model_map[client_name]["chat"]
-                response = self._generate_llm_response(
-                    full_messages, temperature, client, model
-                )
+                client = self.client_model_map[provider]["instructor"]
+                with LLM_REQUEST_SECONDS.time(
+                    provider=provider, model=model, mode="structured"
+                ):
+                    response = client.create(
+                        model=model,
+                        temperature=temperature,
+                        messages=full_messages,
+                        response_model=AIResponse,
+                        timeout=LLM_REQUEST_TIMEOUT,
+                    )
+                raw_response = getattr(response, "_raw_response", None)
+                record_usage(provider, model, getattr(raw_response, "usage", None))
+                return response
+            client = self.client_model_map[provider]["chat"]
+            return self._generate_llm_response(
+                full_messages, temperature, client, model, provider
+            )
+
+        # retry_count bounds how many other providers may be hedged or failed over to
+        fallbacks = [name for name in LLM_FALLBACK_PROVIDERS if name != client_name]
+        return self.router.call(
+            complete, preferred=client_name, fallbacks=fallbacks[:retry_count]
+        )
 
+    def _open_stream(
+        self,
+        provider: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+    ) -> Optional[OpenedStream]:
+        """
+        Starts a streamed completion and waits for its first text delta, so
+        the router can hedge and time out on time-to-first-token.
+        """
+        model = self.client_model_map[provider]["model"]
+        client = self.client_model_map[provider]["chat"]
+        logger.info(f"Streaming LLM response with {provider}")
+        start = time.perf_counter()
+        stream = client.chat.completions.create(
+            model=model,
+            temperature=temperature,
+            messages=messages,
+            stream=True,
+            timeout=LLM_REQUEST_TIMEOUT,
+        )
+        chunks = iter(stream)
+        try:
+            for chunk in chunks:
+                record_usage(provider, model, getattr(chunk, "usage", None))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    LLM_FIRST_TOKEN_SECONDS.observe(
+                        time.perf_counter() - start, provider=provider, model=model
+                    )
+                    return OpenedStream(
+                        provider, model, stream, chunks, chunk.choices[0].delta.content, start
+                    )
+        except Exception:
+            _close_stream(stream)
+            raise
+        _close_stream(stream)
+        logger.warning(f"{provider} stream ended without any text")
+        return None
+
+    @traced(LLM_METHOD_SECONDS)
+    def stream_llm_response(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        client_name: str = "groq",
+        request_type: RequestType = RequestType.conversation,
+        retry_count: int = 1,
+    ) -> Iterator[str]:
+        """
+        Yields response text deltas as the provider streams them.
+
+        OpenAI, Groq and Together stream through the same chat completions API.
+        Streams are opened through the router: the hedge delay and
+        ``LLM_REQUEST_TIMEOUT`` apply to the first token, and the provider's
+        breaker sees failures before and after it. Providers without streaming
+        support yield the full response once. A failure after the first
+        token raises ``StreamInterrupted``.
+        """
+        if client_name == "anthropic":
+            response = self.llm_response(
+                messages, temperature, client_name, request_type, retry_count=0
+            )
             if response is not None:
-                return response
+                yield response.content
+            return
 
-            logger.error(f"Attempt {attempt} failed for {client_name}. Retrying...")
-            if attempt < retry_count:
-                client_name = "openai"  # Switch to openai for retry
-            attempt += 1
+        system_prompt = self.system_prompt_map[request_type.value]
+        full_messages = [
+            {"role": "system", "content": system_prompt},
+            *messages,
+        ]
+        fallbacks = [
+            name
+            for name in LLM_FALLBACK_PROVIDERS
+            if name not in (client_name, "anthropic")
+        ]
+        opened = self.router.call(
+            lambda provider: self._open_stream(provider, full_messages, temperature),
+            preferred=client_name,
+            fallbacks=fallbacks[:retry_count],
+            discard=lambda losing: _close_stream(losing.stream),
+        )
+        if opened is None:
+            return
 
-        return None  # Return None if all retries fail
+        status = "ok"
+        try:
+            yield opened.first
+            for chunk in opened.chunks:
+                record_usage(opened.provider, opened.model, getattr(chunk, "usage", None))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            status = "error"
+            logger.error(f"Error streaming LLM response from {opened.provider}: {e}")
+            self.router.record(opened.provider, time.perf_counter() - opened.started, False)
+            raise StreamInterrupted(opened.provider) from e
+        finally:
+            _close_stream(opened.stream)
+            LLM_REQUEST_SECONDS.observe(
+                time.perf_counter() - opened.started,
+                provider=opened.provider,
+                model=opened.model,
+                mode="stream",
+                status=status,
+            )
 
+    @traced(LLM_METHOD_SECONDS)
     def format_response_in_markdown(self, response: str) -> Optional[str]:
         try:
-            return self.llm_response(
-                messages=[
-                    {"role": "system", "content": formatting_prompt},
-                    {"role": "user", "content": response},
-                ],
-                temperature=0.0,
-                client_name="groq",
-                structured=False,
-            ).content.strip()
+            return markdown_to_mrkdwn(response).strip()
         except Exception as e:
             logger.error(f"Error formatting response in markdown: {e}")
             return None
 
+    @traced(LLM_METHOD_SECONDS)
     def create_title_from_transcript(self, transcript: str) -> Optional[str]:
         try:
             return self.llm_response(
@@ -247,15 +505,52 @@ class LLMClient:
             logger.error(f"Error creating title from transcript: {e}")
             return None
 
+    @traced(LLM_METHOD_SECONDS)
+    def embed_texts(
+        self, texts: List[str], batch_size: int = 256
+    ) -> Optional[List[List[float]]]:
+        try:
+            embeddings = []
+            for start in range(0, len(texts), batch_size):
+                response = self.openai_client.embeddings.create(
+                    model=EMBEDDING_MODEL, input=texts[start : start + batch_size]
+                )
+                embeddings.extend(item.embedding for item in response.data)
+            return embeddings
+        except Exception as e:
+            logger.error(f"Error embedding texts: {e}")
+            return None
+
+    @traced(LLM_METHOD_SECONDS)
+    def summarize_conversation(
+        self,
+        messages: List[Dict[str, str]],
+        previous_summary: Optional[str] = None,
+        client_name: str = "groq",
+    ) -> Optional[str]:
+        transcript = "\n".join(
+            f"{message['role']}: {message.get('content', '')}" for message in messages
+        )
+        if previous_summary:
+            transcript = f"Previous summary:\n{previous_summary}\n\nNew messages:\n{transcript}"
+        try:
+            return self.llm_response(
+                messages=[
+                    {"role": "system", "content": summarize_conversation},
+                    {"role": "user", "content": transcript},
+                ],
+                temperature=0.0,
+                client_name=client_name,
+                structured=False,
+            ).content.strip()
+        except Exception as e:
+            logger.error(f"Error summarizing conversation: {e}")
+            return None
+
     def _process_audio_file(self, file_url: str, file_type: str) -> Optional[str]:
         try:
-            audio_file_path = save_file(file_url, file_type)
-            audio_file = open(audio_file_path, "rb")
-            transcription = self.openai_client.audio.transcriptions.create(
-                model="whisper-1", file=audio_file
-            )
-            delete_file(audio_file_path)
-            return transcription.text
+            with downloaded_file(file_url, file_type) as audio_file_path:
+                return self.transcribe_audio_file(audio_file_path)
         except Exception as e:
             logger.error(f"Error processing audio file: {e}")
             return None
@@ -263,6 +558,30 @@ class LLMClient:
     def transcribe_audio(self, file_url: str, file_type: str) -> Optional[str]:
         return self._process_audio_file(file_url, file_type)
 
+    @traced(LLM_METHOD_SECONDS)
+    def transcribe_audio_file(self, file_path: str) -> Optional[str]:
+        try:
+            return transcribe_in_segments(
+                file_path,
+                self._transcribe_segment,
+                concurrency=AUDIO_TRANSCRIBE_CONCURRENCY,
+            )
+        except Exception as e:
+            logger.error(f"Error transcribing audio file: {e}")
+            return None
+
+    @traced(LLM_METHOD_SECONDS)
+    def _transcribe_segment(self, file_path: str) -> Optional[str]:
+        try:
+            with open(file_path, "rb") as audio_file:
+                transcription = self.whisper_client.audio.transcriptions.create(
+                    model=WHISPER_MODEL, file=audio_file
+                )
+            return transcription.text
+        except Exception as e:
+            logger.error(f"Error transcribing audio segment: {e}")
+            return None
+
     def _save_speech_file(self, text: str, file_path: str) -> None:
         try:
             response = self.openai_client.audio.speech.create(
@@ -277,15 +596,25 @@ class LLMClient:
         speech_file_path = "tmp/speech.mp3"
         self._save_speech_file(text, speech_file_path)
 
+    @traced(LLM_METHOD_SECONDS)
     def describe_vision_anthropic(
-        self, file_url: str, image_media_type: str, message: Optional[str] = None
+        self,
+        file_url: str,
+        image_media_type: str,
+        message: Optional[str] = None,
+        image_data: Optional[str] = None,
     ) -> Optional[str]:
         try:
             if message:
                 prompt = f"The user's request is {message}. Your job is to describe this image in as much detail as possible as it relates to the user's request to be used in your response."
             else:
                 prompt = "Describe this image in as much detail as possible. Extract as much information as possible from the image."
-            image_data = get_file_data(file_url)
+            if image_data is None:
+                extension = image_media_type.split("/")[-1]
+                with downloaded_file(file_url, extension) as image_path:
+                    image_data, image_media_type = normalize_image(
+                        image_path, max_dimension_for("anthropic")
+                    )
             messages = [
                 {
                     "role": "user",
@@ -305,18 +634,32 @@ class LLMClient:
                     ],
                 }
             ]
-            response = self.anthropic_client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=4000,
-                messages=messages,
-            )
+            model = "claude-3-haiku-20240307"
+            with LLM_REQUEST_SECONDS.time(
+                provider="anthropic", model=model, mode="vision"
+            ):
+                response = self.anthropic_client.messages.create(
+                    model=model,
+                    max_tokens=4000,
+                    messages=messages,
+                )
+            record_usage("anthropic", model, response.usage)
             return response.content[0].text
         except Exception as e:
             logger.error(f"Error describing vision: {e}")
             return None
 
-    def describe_image(self, file_url: str) -> Optional[str]:
+    @traced(LLM_METHOD_SECONDS)
+    def describe_image(
+        self,
+        file_url: str,
+        image_data: Optional[str] = None,
+        image_media_type: str = "image/jpeg",
+    ) -> Optional[str]:
         try:
+            # Inline normalized data when available so OpenAI never fetches the original
+            if image_data is not None:
+                file_url = f"data:{image_media_type};base64,{image_data}"
             messages = [
                 {
                     "role": "user",
@@ -329,11 +672,14 @@ class LLMClient:
                     ],
                 }
             ]
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4-turbo",
-                messages=messages,
-                max_tokens=2000,
-            )
+            model = "gpt-4-turbo"
+            with LLM_REQUEST_SECONDS.time(provider="openai", model=model, mode="vision"):
+                response = self.openai_client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=2000,
+                )
+            record_usage("openai", model, response.usage)
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Error describing image: {e}")
@@ -1,70 +1,68 @@
 # main.py
 
+from .startup import boot
+
 import os
+import uvicorn
+from fastapi import FastAPI, Request, Response
 from slack_bolt import App
+from slack_bolt.adapter.fastapi import SlackRequestHandler
 from .config import SLACK_BOT_TOKEN, SLACK_SIGNING_SECRET
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from .handlers.message_handler import MessageHandler
-from .slack_api import SlackClient
+from .handlers.slack_events import register_handlers
+from .slack_api import GatewayWebClient, SlackClient
 from .llm import LLMClient
 from .database import Database
+from .extractors import start_pdf_workers
+from .identity import identity
+from .metrics import CONTENT_TYPE, registry
 
+boot.imports_done()
 
-app = App(token=SLACK_BOT_TOKEN, signing_secret=SLACK_SIGNING_SECRET)
-slack_client = SlackClient(app)
-llm_client = LLMClient()
-database = Database()
-message_handler = MessageHandler(slack_client, llm_client, database)
-
-
-@app.event("url_verification")
-def handle_url_verification(ack, body):
-    challenge = body.get("challenge")
-    ack(challenge)
-
-
-@app.event("message")
-def handle_message(ack, client, event, message, say):
-    message_handler.handle_message(ack, client, event, message, say)
-
-
-@app.event("reaction_added")
-def handle_reaction_added(ack, client, event):
-    message_handler.handle_reaction_added(ack, client, event)
-
-
-# Command handlers
-@app.command("/sparrow")
-def handle_sparrow(ack, client, respond, command):
-    message_handler.handle_sparrow(ack, client, respond, command)
-
+with boot.phase("pdf_workers"):
+    # Forked before any thread exists
+    start_pdf_workers()
+with boot.phase("slack_app"):
+    app = App(
+        token=SLACK_BOT_TOKEN,
+        signing_secret=SLACK_SIGNING_SECRET,
+        client=GatewayWebClient(token=SLACK_BOT_TOKEN),
+    )
+    slack_client = SlackClient(app.client)
+with boot.phase("identity"):
+    identity.resolve(app.client)
+with boot.phase("llm_client"):
+    llm_client = LLMClient()
+with boot.phase("database"):
+    database = Database.get_instance()
+    database.ensure_indexes_in_background()
+with boot.phase("message_handler"):
+    message_handler = MessageHandler(slack_client, llm_client, database)
 
-# Action handlers
-@app.action("start_onboarding")
-def handle_onboarding_modal_open(ack, body, client):
-    message_handler.handle_onboarding_modal_open(ack, body, client)
+api = FastAPI()
+slack_handler = SlackRequestHandler(app)
 
 
-@app.action("create_jira_yes")
-def handle_create_jira_yes(ack, body, client, respond):
-    message_handler.handle_create_jira_yes(ack, body, client, respond)
+@api.post("/slack/events")
+async def slack_events(req: Request):
+    return await slack_handler.handle(req)
 
 
-@app.action("create_jira_no")
-def handle_create_jira_no(ack, body, client, say, respond):
-    message_handler.handle_create_jira_no(ack, body, client, say, respond)
+@api.get("/metrics")
+def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
 
 
-# View handlers
-@app.view("onboarding_modal")
-def handle_onboarding_modal_submit(ack, body, view):
-    message_handler.handle_onboarding_modal_submit(ack, body, view)
+register_handlers(app, message_handler)
 
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 3000))
     print(f"Starting app on port {port}")
-    app.start(port=port)
+    boot.ready()
+    # Slack events and /metrics share the port the Bolt dev server used to own
+    uvicorn.run(api, host="0.0.0.0", port=port)
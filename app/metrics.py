@@ -0,0 +1,375 @@
+# metrics.py
+
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+from .logger import logger
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+Sample = Tuple[str, Dict[str, str], float]
+# (name, type, documentation, samples) of one metric, as plain picklable data
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _render_family(name: str, type_name: str, documentation: str, samples: List[Sample]) -> str:
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {type_name}"]
+    for sample_name, labels, value in samples:
+        lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines)
+
+
+class Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return _render_family(self.name, self.type_name, self.documentation, self.samples())
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, self._labels(key), value) for key, value in values]
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket counts followed by the running sum
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """
+        Observes the wall-clock duration of the block. A ``status`` label, when
+        declared, is set to ``ok`` or ``error`` depending on how the block exits.
+        """
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except GeneratorExit:
+            # A consumer stopping a stream early is not a failure
+            raise
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            if "status" in self.labelnames:
+                labels["status"] = status
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        samples = []
+        for key, values in series:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                samples.append(
+                    (f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative)
+                )
+            samples.append((f"{self.name}_sum", labels, values[-1]))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class CallbackGauge(Metric):
+    """
+    A gauge whose values are read from ``callback`` at scrape time, so caches
+    and routers need no extra bookkeeping. The callback returns a mapping of
+    label tuples (in ``labelnames`` order) to values.
+    """
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Dict[Tuple[str, ...], float]],
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def samples(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.error(f"Error collecting gauge {self.name}: {e}")
+            return []
+        return [
+            (self.name, self._labels(tuple(key)), value) for key, value in values.items()
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            # Re-registering replaces the previous collector, e.g. on app reload
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Dict[Tuple[str, ...], float]],
+    ) -> CallbackGauge:
+        return self.register(CallbackGauge(name, documentation, labelnames, callback))
+
+    def render(self) -> str:
+        """
+        Renders every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def snapshot(self) -> List[Family]:
+        """
+        Collects every metric's current samples, e.g. to send them to another
+        process for ``render_merged``.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [
+            (metric.name, metric.type_name, metric.documentation, metric.samples())
+            for metric in metrics
+        ]
+
+
+def render_merged(snapshots: Dict[str, List[Family]], label: str = "worker") -> str:
+    """
+    Renders registry snapshots of several processes as one exposition. Each
+    sample gets ``label`` set to the key of its snapshot, unless the metric
+    already has a label of that name.
+    """
+    families: Dict[str, Tuple[str, str, List[Sample]]] = {}
+    for source, snapshot in snapshots.items():
+        for name, type_name, documentation, samples in snapshot:
+            family = families.setdefault(name, (type_name, documentation, []))
+            family[2].extend(
+                (sample_name, {label: source, **labels}, value)
+                for sample_name, labels, value in samples
+            )
+    return (
+        "\n".join(
+            _render_family(name, type_name, documentation, samples)
+            for name, (type_name, documentation, samples) in families.items()
+        )
+        + "\n"
+    )
+
+
+registry = MetricsRegistry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SLACK_API_SECONDS = registry.histogram(
+    "sparrow_slack_api_seconds", "Slack Web API call latency.", ("method", "status")
+)
+HANDLER_SECONDS = registry.histogram(
+    "sparrow_handler_seconds",
+    "Time spent handling Slack events, commands and actions.",
+    ("method", "status"),
+)
+MONGO_COMMAND_SECONDS = registry.histogram(
+    "sparrow_mongo_command_seconds", "MongoDB command latency.", ("command", "status")
+)
+LLM_METHOD_SECONDS = registry.histogram(
+    "sparrow_llm_method_seconds", "LLMClient method latency.", ("method", "status")
+)
+LLM_REQUEST_SECONDS = registry.histogram(
+    "sparrow_llm_request_seconds",
+    "Latency of a single LLM provider request.",
+    ("provider", "model", "mode", "status"),
+)
+LLM_FIRST_TOKEN_SECONDS = registry.histogram(
+    "sparrow_llm_first_token_seconds",
+    "Time to the first streamed token.",
+    ("provider", "model"),
+)
+LLM_TOKENS = registry.counter(
+    "sparrow_llm_tokens_total", "Tokens reported by LLM providers.", ("provider", "model", "kind")
+)
+FILE_STAGE_SECONDS = registry.histogram(
+    "sparrow_file_stage_seconds", "FileHandler stage latency.", ("stage", "type", "status")
+)
+PIPELINE_STAGE_SECONDS = registry.histogram(
+    "sparrow_pipeline_stage_seconds",
+    "Message pipeline stage latency.",
+    ("pipeline", "stage"),
+)
+
+_cache_ratios: Dict[str, Callable[[], float]] = {}
+
+
+def register_cache(name: str, hit_ratio: Callable[[], float]) -> None:
+    """
+    Exposes a cache's hit ratio as ``sparrow_cache_hit_ratio{cache=name}``.
+    """
+    _cache_ratios[name] = hit_ratio
+
+
+registry.gauge(
+    "sparrow_cache_hit_ratio",
+    "Hit ratio of in-process caches.",
+    ("cache",),
+    lambda: {(name,): ratio() for name, ratio in list(_cache_ratios.items())},
+)
+
+
+def record_usage(provider: str, model: str, usage) -> None:
+    """
+    Counts prompt and completion tokens from an OpenAI- or Anthropic-style
+    ``usage`` object, if the provider returned one.
+    """
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None)
+    completion = getattr(usage, "completion_tokens", None) or getattr(
+        usage, "output_tokens", None
+    )
+    if prompt:
+        LLM_TOKENS.inc(prompt, provider=provider, model=model, kind="prompt")
+    if completion:
+        LLM_TOKENS.inc(completion, provider=provider, model=model, kind="completion")
+
+
+def traced(histogram: Histogram, **labels) -> Callable:
+    """
+    Decorates a function so each call is observed in ``histogram`` under a
+    ``method`` label named after the function. Generators are timed until
+    they are exhausted rather than until they are created.
+    """
+
+    def decorator(func):
+        method_labels = {"method": func.__name__, **labels}
+
+        if inspect.isgeneratorfunction(func):
+
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                with histogram.time(**method_labels):
+                    yield from func(*args, **kwargs)
+
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**method_labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Observes the duration of every MongoDB command reported by the driver.
+    """
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        MONGO_COMMAND_SECONDS.observe(
+            event.duration_micros / 1e6, command=event.command_name, status="ok"
+        )
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        MONGO_COMMAND_SECONDS.observe(
+            event.duration_micros / 1e6, command=event.command_name, status="error"
+        )
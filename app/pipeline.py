@@ -0,0 +1,112 @@
+# pipeline.py
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .logger import logger
+from .metrics import PIPELINE_STAGE_SECONDS
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _default_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                from .config import PIPELINE_WORKERS
+
+                _executor = ThreadPoolExecutor(
+                    max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline"
+                )
+    return _executor
+
+
+class Stage:
+    def __init__(self, name: str, func: Callable[..., Any], depends_on: Iterable[str]):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+
+
+class Pipeline:
+    """
+    A small dependency graph of stages.
+
+    Each stage starts as soon as the stages it depends on have finished and
+    receives their results as keyword arguments, so independent stages run
+    concurrently and the total latency approaches that of the slowest chain
+    rather than the sum of all stages. Per-stage wall-clock timings are kept in
+    ``timings``.
+    """
+
+    def __init__(self, name: str = "pipeline", executor: Optional[ThreadPoolExecutor] = None):
+        self.name = name
+        self.executor = executor or _default_executor()
+        self.stages: Dict[str, Stage] = {}
+        self.timings: Dict[str, float] = {}
+
+    def add(
+        self, name: str, func: Callable[..., Any], depends_on: Iterable[str] = ()
+    ) -> "Pipeline":
+        """
+        Adds a stage.
+
+        :param name: Stage name; its result is passed to dependants under this keyword.
+        :param func: Callable taking the results of ``depends_on`` as keyword arguments.
+        :param depends_on: Names of stages that must finish first.
+        """
+        self.stages[name] = Stage(name, func, depends_on)
+        return self
+
+    def _run_stage(self, stage: Stage, inputs: Dict[str, Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return stage.func(**inputs)
+        finally:
+            self.timings[stage.name] = time.perf_counter() - start
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Runs every stage and returns their results by name. The first stage
+        exception is re-raised once running stages have finished.
+        """
+        start = time.perf_counter()
+        results: Dict[str, Any] = {}
+        pending = dict(self.stages)
+        running = {}
+        error = None
+
+        while pending or running:
+            if error is None:
+                for name, stage in list(pending.items()):
+                    if all(dependency in results for dependency in stage.depends_on):
+                        inputs = {dependency: results[dependency] for dependency in stage.depends_on}
+                        running[self.executor.submit(self._run_stage, stage, inputs)] = name
+                        del pending[name]
+            if not running:
+                if error is None and pending:
+                    raise ValueError(f"Unsatisfiable stage dependencies: {list(pending)}")
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    logger.error(f"{self.name} stage {name} failed: {e}")
+                    error = error or e
+
+        self.timings["total"] = time.perf_counter() - start
+        for stage, seconds in self.timings.items():
+            PIPELINE_STAGE_SECONDS.observe(seconds, pipeline=self.name, stage=stage)
+        logger.info(
+            f"{self.name} timings: "
+            + ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.timings.items())
+        )
+        if error is not None:
+            raise error
+        return results
@@ -0,0 +1,182 @@
+# retrieval.py
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import Binary
+
+from .cache import TTLCache
+from .context import TokenCounter
+from .logger import logger
+
+EMBEDDING_DTYPE = "float16"
+
+
+def chunk_text(
+    text: str,
+    counter: TokenCounter,
+    chunk_tokens: int = 400,
+    overlap_tokens: int = 50,
+    model: str = "text-embedding-3-small",
+) -> List[str]:
+    """
+    Splits text into overlapping chunks of roughly ``chunk_tokens`` tokens.
+    """
+    encoding = counter.encoding(model)
+    tokens = encoding.encode(text or "", disallowed_special=())
+    step = max(1, chunk_tokens - overlap_tokens)
+    chunks = []
+    for start in range(0, len(tokens), step):
+        chunk = encoding.decode(tokens[start : start + chunk_tokens]).strip()
+        if chunk:
+            chunks.append(chunk)
+        if start + chunk_tokens >= len(tokens):
+            break
+    return chunks
+
+
+class DocumentIndex:
+    """
+    Per-thread retrieval over uploaded documents.
+
+    Large extracted texts are chunked and embedded once at upload time. The
+    chunk texts and a normalized float16 embedding matrix are stored in the
+    ``thread_documents`` collection next to the thread, so later turns only
+    send the top-k chunks relevant to the current message to the LLM.
+    """
+
+    def __init__(
+        self,
+        llm_client,
+        database,
+        min_tokens: int = 1500,
+        chunk_tokens: int = 400,
+        overlap_tokens: int = 50,
+        top_k: int = 5,
+        max_chunks: int = 2000,
+    ):
+        """
+        :param llm_client: LLMClient used to embed chunks and queries.
+        :param database: Database holding the thread documents.
+        :param min_tokens: Texts shorter than this are inlined rather than indexed.
+        :param top_k: Number of chunks returned per query.
+        :param max_chunks: Cap per document, keeping each Mongo document small.
+        """
+        self.llm_client = llm_client
+        self.database = database
+        self.min_tokens = min_tokens
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.top_k = top_k
+        self.max_chunks = max_chunks
+        self.counter = TokenCounter()
+        self._matrices = TTLCache(maxsize=256, ttl=3600)
+
+    def index_large_files(
+        self, thread_id: Any, file_data: List[Dict[str, str]]
+    ) -> Tuple[List[Dict[str, str]], int]:
+        """
+        Indexes extracted texts above ``min_tokens`` and replaces them in
+        ``file_data`` with a short note.
+
+        :return: The updated file data and the number of documents indexed.
+        """
+        updated, indexed = [], 0
+        for file in file_data:
+            content = file.get("content") or ""
+            if (
+                file.get("upload_type") != "text_file"
+                or self.counter.count(content, "gpt-4-turbo") < self.min_tokens
+            ):
+                updated.append(file)
+                continue
+            name = file.get("name") or "document"
+            num_chunks = self.add_document(thread_id, name, content)
+            if not num_chunks:
+                updated.append(file)
+                continue
+            indexed += 1
+            updated.append(
+                {
+                    **file,
+                    "content": f"'{name}' was indexed ({num_chunks} sections). "
+                    "Relevant excerpts are included with each message.",
+                }
+            )
+        return updated, indexed
+
+    def add_document(self, thread_id: Any, name: str, text: str) -> int:
+        import numpy as np
+
+        chunks = chunk_text(
+            text, self.counter, self.chunk_tokens, self.overlap_tokens
+        )[: self.max_chunks]
+        if not chunks:
+            return 0
+        embeddings = self.llm_client.embed_texts(chunks)
+        if embeddings is None:
+            return 0
+
+        matrix = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        self.database.add_thread_document(
+            thread_id,
+            {
+                "name": name,
+                "chunks": chunks,
+                "dim": int(matrix.shape[1]),
+                "embeddings": Binary(matrix.astype(EMBEDDING_DTYPE).tobytes()),
+            },
+        )
+        self._matrices.pop(thread_id)
+        logger.info(f"Indexed {name} into {len(chunks)} chunks")
+        return len(chunks)
+
+    def retrieve(self, thread: Dict[str, Any], query: str) -> List[str]:
+        """
+        Returns the ``top_k`` chunks from the thread's documents most similar
+        to ``query``, or the opening chunks when there is no query text.
+        """
+        import numpy as np
+
+        if not thread or not thread.get("num_files"):
+            return []
+        loaded = self._load(thread["_id"])
+        if loaded is None:
+            return []
+        chunks, matrix = loaded
+
+        if not query or not query.strip():
+            return chunks[: self.top_k]
+        query_embedding = self.llm_client.embed_texts([query])
+        if query_embedding is None:
+            return []
+        vector = self._normalize(np.asarray(query_embedding, dtype=np.float32))[0]
+        scores = matrix.astype(np.float32) @ vector
+        k = min(self.top_k, len(chunks))
+        best = np.argpartition(-scores, k - 1)[:k]
+        # Present excerpts in document order for readability
+        return [chunks[index] for index in sorted(best)]
+
+    def _load(self, thread_id: Any) -> Optional[Tuple[List[str], Any]]:
+        import numpy as np
+
+        cached = self._matrices.get(thread_id)
+        if cached is not None:
+            return cached
+        chunks, matrices = [], []
+        for document in self.database.find_thread_documents(thread_id):
+            matrix = np.frombuffer(document["embeddings"], dtype=EMBEDDING_DTYPE)
+            matrices.append(matrix.reshape(-1, document["dim"]))
+            chunks.extend(document["chunks"])
+        if not chunks:
+            return None
+        loaded = (chunks, np.vstack(matrices))
+        self._matrices.set(thread_id, loaded)
+        return loaded
+
+    @staticmethod
+    def _normalize(matrix):
+        import numpy as np
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
@@ -0,0 +1,282 @@
+# router.py
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from .logger import logger
+
+
+class ProviderStats:
+    """
+    Rolling latency and error statistics for one provider/model.
+    """
+
+    def __init__(self, window: int = 100):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, success: bool) -> None:
+        with self._lock:
+            self.outcomes.append(success)
+            if success:
+                self.latencies.append(latency)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    @property
+    def p50(self) -> Optional[float]:
+        return self.percentile(50)
+
+    @property
+    def p95(self) -> Optional[float]:
+        return self.percentile(95)
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    @property
+    def samples(self) -> int:
+        return len(self.latencies)
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and rejects calls for
+    ``reset_timeout`` seconds, then lets a single trial call through (half-open).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """
+        Read-only check of whether ``allow`` would currently let a call
+        through; it never changes the breaker's state.
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            if self.state == self.HALF_OPEN:
+                return not self.trial_in_flight
+            return True
+
+    def allow(self) -> bool:
+        """
+        Admits a call. Once the reset timeout has passed, exactly one trial
+        call is admitted until it records its outcome.
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self.trial_in_flight:
+                    return False
+                self.trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Circuit breaker opened")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ProviderRouter:
+    """
+    Routes LLM calls across providers.
+
+    The preferred provider is called first. If it has not answered after the
+    hedge delay (its rolling p95, capped at ``hedge_delay``) or it fails, the
+    next healthy provider is called too and whichever succeeds first wins.
+    Providers whose circuit breaker is open are skipped, and no call waits
+    longer than ``timeout`` in total.
+    """
+
+    def __init__(
+        self,
+        hedge_delay: float = 4.0,
+        timeout: float = 30.0,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        max_workers: int = 16,
+    ):
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.stats: Dict[str, ProviderStats] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="llm-router"
+        )
+        self._lock = threading.Lock()
+
+    def _stats(self, provider: str) -> ProviderStats:
+        with self._lock:
+            if provider not in self.stats:
+                self.stats[provider] = ProviderStats()
+                self.breakers[provider] = CircuitBreaker(
+                    self.failure_threshold, self.reset_timeout
+                )
+            return self.stats[provider]
+
+    def _breaker(self, provider: str) -> CircuitBreaker:
+        self._stats(provider)
+        return self.breakers[provider]
+
+    def healthy(self, provider: str) -> bool:
+        return self._breaker(provider).available()
+
+    def candidates(self, preferred: str, fallbacks: List[str]) -> List[str]:
+        ordered = [preferred] + [name for name in fallbacks if name != preferred]
+        healthy = [name for name in ordered if self.healthy(name)]
+        # If every breaker is open, still try the preferred provider
+        return healthy or [preferred]
+
+    def _hedge_delay_for(self, provider: str) -> float:
+        stats = self._stats(provider)
+        if stats.samples >= 10 and stats.p95 is not None:
+            return min(stats.p95, self.hedge_delay)
+        return self.hedge_delay
+
+    def record(self, provider: str, latency: float, success: bool) -> None:
+        """
+        Records the outcome of a call to ``provider`` in its stats and breaker,
+        e.g. a stream that failed after the router had returned it.
+        """
+        self._stats(provider).record(latency, success)
+        breaker = self._breaker(provider)
+        if success:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    def _run(self, func: Callable[[str], Any], provider: str) -> Any:
+        start = time.monotonic()
+        try:
+            result = func(provider)
+        except Exception as e:
+            logger.error(f"Provider {provider} failed: {e}")
+            result = None
+        self.record(provider, time.monotonic() - start, result is not None)
+        return result
+
+    def call(
+        self,
+        func: Callable[[str], Any],
+        preferred: str,
+        fallbacks: List[str],
+        discard: Optional[Callable[[Any], None]] = None,
+    ) -> Any:
+        """
+        Calls ``func(provider)`` with hedging across providers.
+
+        :param func: Performs the request for a provider name; returns None or raises on failure.
+        :param preferred: Provider to try first.
+        :param fallbacks: Providers to hedge or fail over to, in order.
+        :param discard: Releases results that lose the race or arrive after
+            the timeout, e.g. by closing an open stream.
+        :return: The first successful result, or None.
+        """
+        queue = self.candidates(preferred, fallbacks)
+        # Every breaker is open: the preferred provider is called regardless
+        forced = queue == [preferred] and not self.healthy(preferred)
+        deadline = time.monotonic() + self.timeout
+        pending = {}
+
+        def launch() -> Optional[str]:
+            while queue:
+                provider = queue.pop(0)
+                # allow() admits a single half-open trial, so it is only asked
+                # for the providers actually called
+                if self._breaker(provider).allow() or forced:
+                    pending[self._executor.submit(self._run, func, provider)] = provider
+                    return provider
+            return None
+
+        current = launch()
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_for = min(remaining, self._hedge_delay_for(current)) if queue else remaining
+            done, _ = wait(list(pending), timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = pending.pop(future)
+                result = future.result()
+                if result is not None:
+                    if provider != preferred:
+                        logger.info(f"Served by fallback provider {provider}")
+                    self._discard_pending(pending, discard)
+                    return result
+            if queue and (not done or not pending):
+                # Primary is slow (hedge) or every in-flight call has failed
+                provider = launch()
+                if provider is not None:
+                    current = provider
+                    logger.info(f"Hedging request to {current}")
+
+        logger.error(f"All providers failed or timed out for {preferred}")
+        self._discard_pending(pending, discard)
+        return None
+
+    @staticmethod
+    def _discard_pending(pending: Dict[Any, str], discard: Optional[Callable[[Any], None]]) -> None:
+        if discard is None:
+            return
+
+        def release(future) -> None:
+            result = future.result()
+            if result is not None:
+                discard(result)
+
+        for future in pending:
+            future.add_done_callback(release)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            provider: {
+                "p50": stats.p50,
+                "p95": stats.p95,
+                "error_rate": stats.error_rate,
+                "state": self.breakers[provider].state,
+            }
+            for provider, stats in list(self.stats.items())
+        }
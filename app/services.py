@@ -2,61 +2,38 @@
 
 from .database import Database
 from .schema import UserSchema
-from bson.objectid import ObjectId
 
 db = Database.get_instance()
 
 
-def create_db_thread(channel_id, ts, oai_thread, vectorstore_id=None):
-    return db.threads.insert_one(
-        {
-            "channel_id": channel_id,
-            "ts": ts,
-            "oai_thread": oai_thread,
-            "vectorstore_id": vectorstore_id,
-            "num_files": 0,
-        }
+def create_db_thread(channel, thread_ts, oai_thread=None, vectorstore_id=None):
+    return db.create_db_thread(
+        channel, thread_ts, oai_thread=oai_thread, vectorstore_id=vectorstore_id
     )
 
 
 def update_thread(thread_id, update_obj):
-    return db.threads.update_one({"_id": thread_id}, {"$set": update_obj})
+    return db.update_thread_by_id(thread_id, update_obj)
 
 
-def find_db_thread(channel_id, ts):
-    return db.threads.find_one({"channel_id": channel_id, "ts": ts})
+def find_db_thread(channel, thread_ts):
+    return db.find_db_thread(channel, thread_ts)
 
 
 def find_db_thread_by_id(thread_id):
-    if type(thread_id) == str:
-        return db.threads.find_one({"_id": ObjectId(thread_id)})
-    else:
-        return db.threads.find_one({"_id": thread_id})
+    return db.find_db_thread_by_id(thread_id)
 
 
 def add_vectorstore_id_to_thread(thread_id, vectorstore_id):
-    if type(thread_id) == str:
-        return db.threads.update_one(
-            {"_id": ObjectId(thread_id)}, {"$set": {"vectorstore_id": vectorstore_id}}
-        )
-    else:
-        return db.threads.update_one(
-            {"_id": thread_id}, {"$set": {"vectorstore_id": vectorstore_id}}
-        )
+    return db.update_thread_by_id(thread_id, {"vectorstore_id": vectorstore_id})
 
 
 def create_user(slack_user_id, name, email):
-    user = {
-        "name": name,
-        "slack_user_id": slack_user_id,
-        "email": email,
-    }
-
-    db.users.insert_one(user)
+    db.create_user(slack_user_id, name, email)
 
 
 def get_user_information(slack_user_id):
-    return db.users.find_one({"slack_user_id": slack_user_id})
+    return db.get_user_information(slack_user_id)
 
 
 if __name__ == "__main__":
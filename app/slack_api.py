@@ -1,8 +1,52 @@
 # slack_api.py
 
-from typing import Any, Dict, List
+import time
+from typing import Any, Dict, List, Optional
+from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from .logger import logger
+from .identity import identity
+from .metrics import SLACK_API_SECONDS
+from .slack_gateway import RateLimited, gateway
+
+# Errors after which the cached bot identity may belong to a stale token
+AUTH_ERRORS = {"account_inactive", "invalid_auth", "token_expired", "token_revoked"}
+
+
+class GatewayWebClient(WebClient):
+    """
+    A WebClient whose calls all go through the shared SlackGateway (rate
+    limits, Retry-After handling, coalesced reads), with the latency of every
+    request observed by method.
+    """
+
+    def api_call(self, api_method: str, **kwargs):
+        try:
+            return gateway.call(api_method, self._timed_api_call, token=self.token, **kwargs)
+        except SlackApiError as e:
+            if e.response.get("error") in AUTH_ERRORS:
+                logger.warning(f"{api_method} failed with {e.response['error']}, resetting bot identity")
+                identity.invalidate()
+            raise
+
+    def _timed_api_call(self, api_method: str, **kwargs):
+        with SLACK_API_SECONDS.time(method=api_method):
+            return super().api_call(api_method, **kwargs)
+
+    @classmethod
+    def from_client(cls, client: WebClient) -> "GatewayWebClient":
+        if isinstance(client, cls):
+            return client
+        return cls(
+            token=client.token,
+            base_url=client.base_url,
+            timeout=client.timeout,
+            ssl=client.ssl,
+            proxy=client.proxy,
+            headers=client.headers,
+            team_id=client.default_params.get("team_id"),
+            retry_handlers=client.retry_handlers,
+        )
 
 
 class SlackClient:
@@ -28,7 +72,7 @@ class SlackClient:
             logger.error(f"Error uploading file: {str(e)}")
 
     def is_bot_thread(self, messages: List[Dict[str, Any]]) -> bool:
-        bot_id = (self.client.auth_test())["user_id"]
+        bot_id = identity.user_id(self.client)
         return any(f"<@{bot_id}>" in msg["content"] for msg in messages)
 
     def fetch_and_format_thread_messages(
@@ -37,7 +81,7 @@ class SlackClient:
         try:
             thread_ts = message["thread_ts"]
             channel_id = message["channel"]
-            bot_id = (self.client.auth_test())["user_id"]
+            bot_id = identity.user_id(self.client)
 
             thread_messages_response = self.client.conversations_replies(
                 channel=channel_id, ts=thread_ts
@@ -54,3 +98,67 @@ class SlackClient:
         except Exception as e:
             logger.error(f"Error fetching or formatting thread messages: {e}")
             return []
+
+
+class StreamingMessage:
+    """
+    A Slack message that is posted once and then edited as text streams in.
+
+    Updates are coalesced so that ``chat_update`` is called at most once per
+    ``interval`` seconds, and intermediate updates are dropped while the
+    gateway's chat.update bucket is empty. The final update always waits.
+    """
+
+    def __init__(
+        self,
+        client,
+        channel: str,
+        thread_ts: Optional[str] = None,
+        interval: float = 0.7,
+        placeholder: str = "_Thinking..._",
+    ):
+        self.client = client
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.interval = interval
+        self.placeholder = placeholder
+        self.text = ""
+        self.ts: Optional[str] = None
+        self._last_update = 0.0
+        self._rendered = ""
+
+    def start(self) -> None:
+        response = self.client.chat_postMessage(
+            channel=self.channel, text=self.placeholder, thread_ts=self.thread_ts
+        )
+        self.ts = response["ts"]
+        self._last_update = time.monotonic()
+
+    def append(self, delta: str) -> None:
+        self.text += delta
+        if time.monotonic() - self._last_update >= self.interval:
+            # Intermediate edits are skipped rather than waited for when the
+            # chat.update budget is spent, so the token loop never blocks
+            try:
+                with gateway.non_blocking():
+                    self._update(self.text)
+            except RateLimited:
+                self._last_update = time.monotonic()
+
+    def finish(self, text: Optional[str] = None) -> str:
+        if text is not None:
+            self.text = text
+        self._update(self.text or self.placeholder)
+        return self.text
+
+    def _update(self, text: str) -> None:
+        if self.ts is None:
+            self.start()
+        if text == self._rendered:
+            return
+        try:
+            self.client.chat_update(channel=self.channel, ts=self.ts, text=text)
+            self._rendered = text
+        except SlackApiError as e:
+            logger.error(f"Error updating streamed message: {e}")
+        self._last_update = time.monotonic()
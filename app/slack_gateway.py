@@ -0,0 +1,289 @@
+# slack_gateway.py
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+
+from slack_sdk.errors import SlackApiError
+
+from .config import SLACK_MAX_RETRIES, SLACK_RATE_BURST
+from .logger import logger
+from .metrics import registry
+
+SLACK_THROTTLED = registry.counter(
+    "sparrow_slack_throttled_total", "Slack calls answered with HTTP 429.", ("method",)
+)
+SLACK_COALESCED = registry.counter(
+    "sparrow_slack_coalesced_total",
+    "Slack reads served by an identical in-flight request.",
+    ("method",),
+)
+
+# Requests per minute for Slack's published rate limit tiers. Buckets are per
+# process: in cluster mode every worker has its own, so the real ceiling is
+# CLUSTER_WORKERS times these rates and Slack's 429s do the rest.
+TIER_RATES = {1: 1, 2: 20, 3: 50, 4: 100}
+
+METHOD_TIERS = {
+    "auth.test": 4,
+    "chat.delete": 3,
+    "chat.postEphemeral": 4,
+    "chat.update": 3,
+    "conversations.history": 3,
+    "conversations.info": 3,
+    "conversations.replies": 3,
+    "files.info": 4,
+    "files.upload": 2,
+    "reactions.add": 3,
+    "users.info": 4,
+    "views.open": 4,
+    "views.publish": 4,
+    "views.update": 4,
+}
+DEFAULT_TIER = 3
+
+# chat.postMessage is limited to about one message per second per channel
+PER_CHANNEL_METHODS = {"chat.postMessage": 60}
+
+# Identical concurrent calls to these methods share a single request
+COALESCED_METHODS = {
+    "auth.test",
+    "conversations.history",
+    "conversations.info",
+    "conversations.replies",
+    "files.info",
+    "users.info",
+}
+
+
+class RateLimited(Exception):
+    """
+    Raised by non-blocking calls when no rate limit token is available.
+    """
+
+    def __init__(self, api_method: str):
+        super().__init__(f"No {api_method} rate limit token available")
+        self.api_method = api_method
+
+
+class TokenBucket:
+    """
+    A blocking token bucket refilled at ``rate`` tokens per second.
+
+    ``pause`` empties the bucket until a deadline, which is how a
+    ``Retry-After`` from Slack holds back every caller of the method.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        """
+        Blocks until a token is available and returns the seconds waited.
+        """
+        start = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    if now >= self.paused_until:
+                        self._refill(now)
+                        if self.tokens >= 1:
+                            self.tokens -= 1
+                            return now - start
+                        delay = (1 - self.tokens) / self.rate
+                    else:
+                        delay = self.paused_until - now
+                time.sleep(delay)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def try_acquire(self) -> bool:
+        """
+        Takes a token if one is available right now, without waiting.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return False
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            # One request may go as soon as the pause ends; the rest refill
+            self.tokens = 1
+            self.updated = self.paused_until
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SlackGateway:
+    """
+    Shared entry point for Slack Web API calls.
+
+    Calls wait for a token from a bucket per method (per method and channel
+    for ``chat.postMessage``) sized to Slack's rate limit tiers, are retried
+    after the ``Retry-After`` delay when Slack answers 429, and identical
+    concurrent reads are coalesced into one request.
+    """
+
+    def __init__(self, max_retries: int = 3, burst: int = 5):
+        self.max_retries = max_retries
+        self.burst = burst
+        self.buckets: Dict[Hashable, TokenBucket] = {}
+        self._inflight: Dict[Hashable, _InFlight] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def non_blocking(self) -> Iterator[None]:
+        """
+        Within this block, calls on the current thread raise ``RateLimited``
+        instead of waiting for a token, and are not retried after a 429.
+        Meant for updates that can simply be skipped, e.g. streaming edits.
+        """
+        previous = getattr(self._local, "non_blocking", False)
+        self._local.non_blocking = True
+        try:
+            yield
+        finally:
+            self._local.non_blocking = previous
+
+    def _bucket(self, api_method: str, channel: Optional[str]) -> TokenBucket:
+        if api_method in PER_CHANNEL_METHODS:
+            key: Hashable = (api_method, channel)
+            per_minute = PER_CHANNEL_METHODS[api_method]
+        else:
+            key = api_method
+            per_minute = TIER_RATES[METHOD_TIERS.get(api_method, DEFAULT_TIER)]
+        with self._lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(per_minute / 60, self.burst)
+            return bucket
+
+    @staticmethod
+    def _arguments(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        arguments = {}
+        for name in ("params", "data", "json"):
+            if isinstance(kwargs.get(name), dict):
+                arguments.update(kwargs[name])
+        return arguments
+
+    def call(
+        self,
+        api_method: str,
+        send: Callable[..., Any],
+        token: Optional[str] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Sends ``api_method`` through ``send`` (the WebClient's own ``api_call``)
+        under the gateway's rate limiting, retry and coalescing rules.
+
+        :param api_method: Slack method name, e.g. ``conversations.replies``.
+        :param send: Callable performing the request.
+        :param token: Token of the calling client, so workspaces never share results.
+        """
+        arguments = self._arguments(kwargs)
+        if api_method not in COALESCED_METHODS or kwargs.get("files"):
+            return self._send(api_method, send, arguments, kwargs)
+
+        key = (api_method, token, json.dumps(arguments, sort_keys=True, default=str))
+        with self._lock:
+            inflight = self._inflight.get(key)
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight[key] = _InFlight()
+        if not leader:
+            SLACK_COALESCED.inc(method=api_method)
+            inflight.done.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.result
+
+        try:
+            inflight.result = self._send(api_method, send, arguments, kwargs)
+            return inflight.result
+        except BaseException as e:
+            inflight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight.done.set()
+
+    def _send(
+        self,
+        api_method: str,
+        send: Callable[..., Any],
+        arguments: Dict[str, Any],
+        kwargs: Dict[str, Any],
+    ) -> Any:
+        bucket = self._bucket(api_method, arguments.get("channel"))
+        non_blocking = getattr(self._local, "non_blocking", False)
+        for attempt in range(self.max_retries + 1):
+            if non_blocking:
+                if not bucket.try_acquire():
+                    raise RateLimited(api_method)
+            else:
+                waited = bucket.acquire()
+                if waited > 1:
+                    logger.info(f"Waited {waited:.1f}s for a {api_method} rate limit token")
+            try:
+                return send(api_method, **kwargs)
+            except SlackApiError as e:
+                if e.response.status_code != 429:
+                    raise
+                headers = {name.lower(): value for name, value in e.response.headers.items()}
+                retry_after = float(headers.get("retry-after", 1))
+                SLACK_THROTTLED.inc(method=api_method)
+                bucket.pause(retry_after)
+                if non_blocking or attempt == self.max_retries:
+                    raise
+                logger.warning(f"{api_method} rate limited, retrying in {retry_after:.0f}s")
+
+    def queue_depth(self) -> Dict[str, int]:
+        depth: Dict[str, int] = {}
+        with self._lock:
+            buckets = list(self.buckets.items())
+        for key, bucket in buckets:
+            api_method = key[0] if isinstance(key, tuple) else key
+            depth[api_method] = depth.get(api_method, 0) + bucket.waiting
+        return depth
+
+
+gateway = SlackGateway(max_retries=SLACK_MAX_RETRIES, burst=SLACK_RATE_BURST)
+
+registry.gauge(
+    "sparrow_slack_queue_depth",
+    "Slack calls waiting for a rate limit token.",
+    ("method",),
+    lambda: {(method,): depth for method, depth in gateway.queue_depth().items()},
+)
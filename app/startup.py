@@ -0,0 +1,158 @@
+# startup.py
+
+import builtins
+import importlib.util
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .config import IMPORT_PROFILE, IMPORT_PROFILE_TOP
+from .logger import logger
+
+
+class ImportProfiler:
+    """
+    Records an ``-X importtime`` style breakdown of first-time imports.
+
+    While active, ``builtins.__import__`` is wrapped so that every import of a
+    module not yet in ``sys.modules`` is timed. Each module gets its self time
+    (excluding imports it triggered) and cumulative time.
+    """
+
+    def __init__(self):
+        self.records: Dict[str, Tuple[float, float]] = {}
+        self._original = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self._original is not None
+
+    def start(self) -> None:
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+
+    def stop(self) -> None:
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _stack(self) -> List[float]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Falls back to the restored builtin if stop() raced with this import
+        original = self._original or builtins.__import__
+        module_name = name
+        if level:
+            package = (globals or {}).get("__package__") or ""
+            try:
+                module_name = importlib.util.resolve_name("." * level + name, package)
+            except (ImportError, ValueError):
+                return original(name, globals, locals, fromlist, level)
+        if module_name in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+
+        stack = self._stack()
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            with self._lock:
+                self.records.setdefault(module_name, (cumulative - children, cumulative))
+
+    def top(self, limit: int = 25) -> List[Tuple[str, float, float]]:
+        """
+        Returns ``(module, self_seconds, cumulative_seconds)`` for the slowest
+        imports by cumulative time.
+        """
+        with self._lock:
+            records = list(self.records.items())
+        records.sort(key=lambda item: item[1][1], reverse=True)
+        return [(module, own, cumulative) for module, (own, cumulative) in records[:limit]]
+
+
+class BootProfile:
+    """
+    Times the phases of process start-up (imports, client construction, index
+    creation) and the delay until the first Slack event is handled.
+    """
+
+    def __init__(self, profile_imports: bool = False, top: int = 25):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.ready_seconds: Optional[float] = None
+        self.first_event_seconds: Optional[float] = None
+        self.top = top
+        self.profiler = ImportProfiler()
+        if profile_imports:
+            self.profiler.start()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def imports_done(self) -> None:
+        self.phases["imports"] = time.perf_counter() - self.started
+        self.profiler.stop()
+
+    def ready(self) -> None:
+        self.ready_seconds = time.perf_counter() - self.started
+        logger.info(
+            f"Boot ready in {self.ready_seconds * 1000:.0f}ms: "
+            + ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+        )
+        if self.profiler.records:
+            lines = [f"{'self [us]':>10} | {'cumulative':>10} | imported module"]
+            for module, own, cumulative in self.profiler.top(self.top):
+                lines.append(f"{own * 1e6:>10.0f} | {cumulative * 1e6:>10.0f} | {module}")
+            logger.info("Slowest imports at boot:\n" + "\n".join(lines))
+        self._register_metrics()
+
+    def first_event(self) -> None:
+        if self.first_event_seconds is None:
+            self.first_event_seconds = time.perf_counter() - self.started
+            logger.info(f"First event after {self.first_event_seconds * 1000:.0f}ms")
+
+    def _register_metrics(self) -> None:
+        from .metrics import registry
+
+        registry.gauge(
+            "sparrow_boot_phase_seconds",
+            "Duration of each start-up phase.",
+            ("phase",),
+            lambda: {
+                **{(name,): seconds for name, seconds in self.phases.items()},
+                ("ready",): self.ready_seconds or 0.0,
+                **(
+                    {("first_event",): self.first_event_seconds}
+                    if self.first_event_seconds is not None
+                    else {}
+                ),
+            },
+        )
+        registry.gauge(
+            "sparrow_boot_import_seconds",
+            "Cumulative import time of the slowest modules at boot.",
+            ("module",),
+            lambda: {(module,): cumulative for module, _, cumulative in self.profiler.top(self.top)},
+        )
+
+
+boot = BootProfile(profile_imports=IMPORT_PROFILE, top=IMPORT_PROFILE_TOP)
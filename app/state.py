@@ -0,0 +1,108 @@
+# state.py
+
+import datetime
+from typing import Any, Callable, Optional
+
+from pymongo.errors import PyMongoError
+
+from .cache import TTLCache
+from .logger import logger
+
+
+class StateStore:
+    """
+    Key-value store for short-lived interaction state, e.g. which thread an
+    ephemeral prompt belongs to. Keys live in a namespace and expire after
+    ``ttl`` seconds.
+    """
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryStateStore(StateStore):
+    """
+    Process-local store. Suitable for a single process and for tests; state is
+    not visible to other workers.
+    """
+
+    def __init__(self, ttl: Optional[float] = 86400, maxsize: int = 10000):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._cache.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        self._cache.set(key, value)
+
+    def delete(self, key: str) -> None:
+        self._cache.pop(key)
+
+
+class MongoStateStore(StateStore):
+    """
+    Store shared by every process through a Mongo collection. Documents carry
+    an ``expires_at`` date covered by a TTL index; reads also check it, since
+    Mongo only purges expired documents about once a minute.
+    """
+
+    def __init__(
+        self,
+        collection_factory: Callable[[], Any],
+        namespace: str,
+        ttl: float = 86400,
+    ):
+        self._collection_factory = collection_factory
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def _id(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            document = self._collection_factory().find_one(
+                {"_id": self._id(key), "expires_at": {"$gt": datetime.datetime.utcnow()}}
+            )
+        except PyMongoError as e:
+            logger.error(f"Failed to read state {self._id(key)}: {e}")
+            return default
+        return default if document is None else document["value"]
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.ttl)
+        try:
+            self._collection_factory().update_one(
+                {"_id": self._id(key)},
+                {"$set": {"value": value, "expires_at": expires_at}},
+                upsert=True,
+            )
+        except PyMongoError as e:
+            logger.error(f"Failed to write state {self._id(key)}: {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            self._collection_factory().delete_one({"_id": self._id(key)})
+        except PyMongoError as e:
+            logger.error(f"Failed to delete state {self._id(key)}: {e}")
+
+
+def build_state_store(backend_name: str, namespace: str, ttl: float) -> StateStore:
+    """
+    Builds the state store for the configured backend name.
+    """
+    if backend_name == "mongo":
+        from .database import Database
+
+        return MongoStateStore(
+            lambda: Database.get_instance().interaction_state_collection,
+            namespace=namespace,
+            ttl=ttl,
+        )
+    return MemoryStateStore(ttl=ttl)
@@ -3,14 +3,13 @@
 import os
 import time
 import re
-import requests
-import httpx
-import base64
+import hashlib
 from functools import wraps
 
 from typing import Optional
 
 from .logger import logger
+from .identity import identity
 
 
 def retry(exception_to_check, tries=4, delay=3, backoff=2, logger=None):
@@ -48,45 +47,6 @@ def retry(exception_to_check, tries=4, delay=3, backoff=2, logger=None):
     return deco_retry
 
 
-def save_file(file_url: str, file_type: str) -> str:
-    """
-    Fetches and saves an audio file from a URL.
-
-    :param file_url: URL of the file to fetch.
-    :param file_type: Type of the file (e.g., 'mp3', 'wav', 'pdf')
-    :return: Path to the saved file.
-    """
-    response = httpx.get(file_url)
-    filename = f"{int(time.time())}.{file_type}"
-    file_path = os.path.join("tmp", filename)
-
-    with open(file_path, "wb") as file:
-        file.write(response.content)
-
-    return file_path
-
-
-def download_and_save_file(file_url: str, file_type: str) -> Optional[str]:
-    try:
-        response = requests.get(file_url, stream=True)
-        timestamp = int(time.time())
-        if response.status_code == 200:
-            file_path = f"/tmp/{timestamp}.{file_type}"
-            with open(file_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return file_path
-        else:
-            logger.error(
-                f"Failed to download file: {file_url} with status code: {response.status_code}"
-            )
-    except Exception as e:
-        logger.error(
-            f"Exception occurred while downloading file: {file_url}, Error: {str(e)}"
-        )
-    return None
-
-
 def delete_file(file_path: str) -> None:
     """
     Deletes a file from the filesystem.
@@ -96,16 +56,18 @@ def delete_file(file_path: str) -> None:
     os.remove(file_path)
 
 
-def get_file_data(file_url: str) -> str:
+def file_digest(file_path: str) -> str:
     """
-    Fetches file data from a URL and encodes it in base64.
+    Computes the SHA-256 digest of a file without loading it all into memory.
 
-    :param file_url: URL of the file to fetch.
-    :return: Base64 encoded string of the file data.
+    :param file_path: Path to the file.
+    :return: Hex encoded digest.
     """
-    response = httpx.get(file_url)
-    file_data = base64.b64encode(response.content).decode("utf-8")
-    return file_data
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(65536), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
 
 
 def add_user_message_to_messages(messages, user_message):
@@ -113,24 +75,34 @@ def add_user_message_to_messages(messages, user_message):
     return messages
 
 
+def format_thread_messages(thread_messages, bot_id):
+    """
+    Converts raw Slack thread messages into LLM chat messages.
+
+    :param thread_messages: Messages as returned by ``conversations_replies``.
+    :param bot_id: User id of the bot, whose messages become assistant turns.
+    :return: A list of ``{"role", "content"}`` dictionaries.
+    """
+    formatted_messages = []
+    for msg in thread_messages:
+        if msg.get("text") != "":
+            role = "assistant" if msg.get("user") == bot_id else "user"
+            formatted_messages.append({"role": role, "content": msg["text"]})
+    return formatted_messages
+
+
 def fetch_thread_messages(client, event):
     try:
         thread_ts = event["thread_ts"]
         channel_id = event["channel"]
-        bot_id = client.auth_test()["user_id"]
+        bot_id = identity.user_id(client)
 
         thread_messages_response = client.conversations_replies(
             channel=channel_id, ts=thread_ts
         )
         thread_messages = thread_messages_response["messages"]
 
-        formatted_messages = []
-        for msg in thread_messages:
-            if msg.get("text") != "":
-                role = "assistant" if msg.get("user") == bot_id else "user"
-                formatted_messages.append({"role": role, "content": msg["text"]})
-
-        return formatted_messages
+        return format_thread_messages(thread_messages, bot_id)
     except Exception as e:
         logger.error(f"Error fetching thread messages: {e}")
         return []
@@ -147,7 +119,7 @@ def fetch_and_format_thread_messages(client, message):
     try:
         thread_ts = message["thread_ts"]
         channel_id = message["channel"]
-        bot_id = client.auth_test()["user_id"]
+        bot_id = identity.user_id(client)
 
         thread_messages_response = client.conversations_replies(
             channel=channel_id, ts=thread_ts